@@ -0,0 +1,63 @@
+import argparse
+import time
+import numpy as np
+import cv2 as cv
+from cyberdesk.vision import MarkerDetector, ParallelMarkerDetector, PyramidMarkerDetector, get_marker_images
+
+def create_test_frame(size, marker_count, marker_size, seed=0):
+	random = np.random.default_rng(seed)
+	width, height = size
+	frame = np.full((height, width), 255, dtype=np.uint8)
+	
+	for marker_id, image in enumerate(get_marker_images(*range(marker_count), size=marker_size)):
+		image = cv.copyMakeBorder(image, 10, 10, 10, 10, cv.BORDER_CONSTANT, value=255)
+		x = random.integers(0, width - image.shape[1])
+		y = random.integers(0, height - image.shape[0])
+		frame[y:y+image.shape[0], x:x+image.shape[1]] = image
+	
+	return frame
+
+def benchmark(name, detect, frame, iterations):
+	detect(frame) # warm up
+	
+	times = []
+	for _ in range(iterations):
+		start = time.perf_counter()
+		corners, ids = detect(frame)
+		times.append(time.perf_counter() - start)
+	
+	found = 0 if ids is None else len(ids)
+	times = np.array(times) * 1000
+	print("{:<20} {:>4} markers  mean {:7.2f}ms  p50 {:7.2f}ms  p95 {:7.2f}ms".format(
+		name, found, times.mean(), np.percentile(times, 50), np.percentile(times, 95)))
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--image", help="grayscale test frame, a synthetic frame is generated if omitted")
+	parser.add_argument("--size", type=int, nargs=2, default=(1920, 1080))
+	parser.add_argument("--markers", type=int, default=20)
+	parser.add_argument("--marker-size", type=int, default=60)
+	parser.add_argument("--tiles", type=int, nargs=2, default=(2, 2))
+	parser.add_argument("--overlap", type=int, default=96)
+	parser.add_argument("--iterations", type=int, default=50)
+	args = parser.parse_args()
+	
+	if args.image:
+		frame = cv.imread(args.image, cv.IMREAD_GRAYSCALE)
+	else:
+		frame = create_test_frame(tuple(args.size), args.markers, args.marker_size)
+	
+	print("frame: {}x{}".format(frame.shape[1], frame.shape[0]))
+	
+	single = MarkerDetector()
+	parallel = ParallelMarkerDetector(tiles=tuple(args.tiles), overlap=args.overlap)
+	pyramid = PyramidMarkerDetector()
+	
+	benchmark("single-threaded", single.detect, frame, args.iterations)
+	benchmark("parallel ({} workers)".format(parallel.workers), parallel.detect, frame, args.iterations)
+	benchmark("pyramid", pyramid.detect, frame, args.iterations)
+	
+	parallel.close()
+
+if __name__ == "__main__":
+	main()
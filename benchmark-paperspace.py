@@ -0,0 +1,73 @@
+import argparse
+import os
+import json
+import time
+import numpy as np
+from cyberdesk.benchmark import SyntheticDesk, synthetic_papers_json, benchmark_paper, run_pipeline, percentiles
+from cyberdesk.vision import ArrayMarkerTracker, MarkerDetector, TrackingMarkerDetector, PyramidMarkerDetector, ParallelMarkerDetector
+from cyberdesk.paperspace import Space
+
+def create_detector(name, tracker):
+	if name == "full":
+		return MarkerDetector()
+	elif name == "tracking":
+		return TrackingMarkerDetector(tracker)
+	elif name == "pyramid":
+		return PyramidMarkerDetector()
+	elif name == "parallel":
+		return ParallelMarkerDetector()
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--papers", type=int, default=10)
+	parser.add_argument("--papers-json", default="papers.json")
+	parser.add_argument("--size", type=int, nargs=2, default=(1280, 720))
+	parser.add_argument("--frames", type=int, default=120)
+	parser.add_argument("--fps", type=float, default=30)
+	parser.add_argument("--moving", type=float, default=0.2, help="fraction of moving papers")
+	parser.add_argument("--noise", type=float, default=4)
+	parser.add_argument("--background")
+	parser.add_argument("--detector", choices=["full", "tracking", "pyramid", "parallel"], default="tracking")
+	parser.add_argument("--seed", type=int, default=0)
+	args = parser.parse_args()
+	
+	papers = []
+	if os.path.exists(args.papers_json):
+		with open(args.papers_json, "r") as file:
+			papers = json.load(file)
+	
+	papers = synthetic_papers_json(args.papers, papers)
+	size = tuple(args.size)
+	
+	print("rendering {} frames of {} papers at {}x{}".format(args.frames, len(papers), *size))
+	desk = SyntheticDesk(size, [paper["markers"] for paper in papers],
+		background=args.background, noise=args.noise, moving=args.moving, seed=args.seed)
+	frames = [desk.render(1 / args.fps) for _ in range(args.frames)]
+	
+	tracker = ArrayMarkerTracker()
+	detector = create_detector(args.detector, tracker)
+	space = Space(size, np.eye(3, dtype=np.float32))
+	for data in papers:
+		space.add_paper(data["id"], benchmark_paper(data, tracker))
+	
+	start = time.perf_counter()
+	stages = run_pipeline(frames, detector.detect, tracker, space, fps=args.fps)
+	duration = time.perf_counter() - start
+	
+	print()
+	print("{:<10} {:>10} {:>10} {:>10} {:>10}".format("stage", "mean", "p50", "p95", "p99"))
+	for name, times in stages.items():
+		times = times * 1000
+		print("{:<10} {:>8.2f}ms {:>8.2f}ms {:>8.2f}ms {:>8.2f}ms".format(name, times.mean(), *percentiles(times)))
+	
+	visible = sum(1 for paper in space.papers.values() if paper.visible)
+	shows = sum(paper.shows for paper in space.papers.values())
+	print()
+	print("throughput: {:.1f} frames/s".format(len(frames) / duration))
+	print("visible papers: {}/{}, shows: {}".format(visible, len(papers), shows))
+	
+	if hasattr(detector, "close"):
+		detector.close()
+
+if __name__ == "__main__":
+	main()
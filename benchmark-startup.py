@@ -0,0 +1,46 @@
+import argparse
+import subprocess
+import sys
+import os
+import json
+import numpy as np
+
+# runs in a fresh interpreter, so every run pays for its imports
+MEASURE_CODE = """
+import time
+import sys
+start = time.perf_counter()
+from cyberdesk.paperspace.papers import get_paper_type, paper_types
+for name in (sys.argv[1:] or list(paper_types)):
+	get_paper_type(name)
+print(time.perf_counter() - start)
+"""
+
+def measure(types, runs):
+	times = []
+	for _ in range(runs):
+		output = subprocess.check_output([sys.executable, "-c", MEASURE_CODE, *types])
+		times.append(float(output.decode().strip().splitlines()[-1]))
+	
+	return np.array(times)
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--papers-json", default="papers.json")
+	parser.add_argument("--runs", type=int, default=10)
+	args = parser.parse_args()
+	
+	types = []
+	if os.path.exists(args.papers_json):
+		with open(args.papers_json, "r") as file:
+			types = sorted(set(data["type"] for data in json.load(file)))
+	
+	print("paper types in {}: {}".format(args.papers_json, ", ".join(types) or "none"))
+	
+	# eager is what importing every paper module up front costs
+	for name, measured_types in [("lazy", types or ["portal-in"]), ("eager", [])]:
+		times = measure(measured_types, args.runs) * 1000
+		print("{:<6} median {:>7.1f}ms  min {:>7.1f}ms".format(name, np.median(times), times.min()))
+
+if __name__ == "__main__":
+	main()
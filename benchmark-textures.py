@@ -0,0 +1,69 @@
+import argparse
+import time
+import numpy as np
+import glfw
+from OpenGL.GL import *
+from cyberdesk.graphics3d import Texture, StreamingTexture, persistent_mapping_supported
+
+def create_hidden_context():
+	if not glfw.init():
+		raise Exception("can't initialize glfw")
+	
+	glfw.window_hint(glfw.VISIBLE, False)
+	glfw.window_hint(glfw.CONTEXT_VERSION_MAJOR, 3)
+	glfw.window_hint(glfw.CONTEXT_VERSION_MINOR, 2)
+	glfw.window_hint(glfw.OPENGL_FORWARD_COMPAT, 1)
+	glfw.window_hint(glfw.OPENGL_PROFILE, glfw.OPENGL_CORE_PROFILE)
+	
+	window = glfw.create_window(64, 64, "benchmark", None, None)
+	if not window:
+		raise Exception("can't create window")
+	
+	glfw.make_context_current(window)
+	return window
+
+def benchmark(name, texture, frames):
+	texture.update(frames[0]) # allocate
+	glFinish()
+	
+	start = time.perf_counter()
+	submit_times = []
+	for frame in frames:
+		submit_start = time.perf_counter()
+		texture.update(frame)
+		submit_times.append(time.perf_counter() - submit_start)
+	glFinish()
+	duration = time.perf_counter() - start
+	
+	megabytes = sum(frame.nbytes for frame in frames) / 1024 / 1024
+	print("{:<28} {:>8.1f} MB/s  {:>6.2f}ms/frame  submit p50 {:>6.2f}ms".format(
+		name, megabytes / duration, duration / len(frames) * 1000, np.percentile(submit_times, 50) * 1000))
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--frames", type=int, default=200)
+	args = parser.parse_args()
+	
+	create_hidden_context()
+	print("Renderer:", glGetString(GL_RENDERER))
+	
+	for size in [(1280, 720), (1920, 1080)]:
+		print()
+		print("{}x{} BGR".format(*size))
+		
+		# a few different frames, so the driver can't skip identical uploads
+		random = np.random.default_rng(0)
+		frames = [random.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8) for _ in range(4)]
+		frames = [frames[i % len(frames)] for i in range(args.frames)]
+		
+		benchmark("Texture", Texture(size, format=GL_BGR, type=GL_UNSIGNED_BYTE), frames)
+		benchmark("StreamingTexture (2 PBOs)", StreamingTexture(size, buffer_count=2, persistent=False, format=GL_BGR, type=GL_UNSIGNED_BYTE), frames)
+		benchmark("StreamingTexture (3 PBOs)", StreamingTexture(size, buffer_count=3, persistent=False, format=GL_BGR, type=GL_UNSIGNED_BYTE), frames)
+		
+		if persistent_mapping_supported():
+			benchmark("StreamingTexture (persistent)", StreamingTexture(size, buffer_count=3, persistent=True, format=GL_BGR, type=GL_UNSIGNED_BYTE), frames)
+	
+	glfw.terminate()
+
+if __name__ == "__main__":
+	main()
@@ -3,10 +3,19 @@ import glfw
 import os
 import platform
 import cv2 as cv
+import numpy as np
 from datetime import datetime
 import time
-from cyberdesk.graphics3d import OrtographicCamera, ortographic_camera_params
-from cyberdesk.vision import get_camera_capture, get_camera_frame
+import cairo
+from cyberdesk.graphics3d import OrtographicCamera, ortographic_camera_params, CanvasTexture, Material, QuadGeometry, quad_shader, render_state, warm_shaders
+from cyberdesk.graphics2d import draw_text_multiline
+from cyberdesk.timing import FrameTimer
+from cyberdesk.scheduler import FrameScheduler, DetectionScheduler
+from cyberdesk.vision import get_camera_capture, CameraStream, VisionLoop
+from cyberdesk.worker import VisionWorker
+from cyberdesk.recording import SessionRecorder, ReplayStream
+from cyberdesk import clock
+from cyberdesk.offscreen import offscreen_context
 from cyberdesk.calibration import load_calibration as do_load_calibration
 from cyberdesk.math import rect_corners
 
@@ -60,7 +69,9 @@ def main_loop_config_args(config, **kwargs):
 	keys = [
 		"projection_size", "camera_size",
 		"monitor_name", "maximize_window",
-		"camera_id",
+		"camera_id", "vision_worker",
+		"record", "replay", "replay_realtime",
+		"offscreen", "vision_thread",
 	]
 	
 	for key in keys:
@@ -96,8 +107,36 @@ class FPSCounter:
 			self.frame_count = 0
 			self.fps_timer = frame_start+1
 
+class TimingOverlay:
+	def __init__(self, size=(560, 640), position=(20, 20)):
+		self.canvas = CanvasTexture(size)
+		self.material = Material(shader=quad_shader(), texture=self.canvas.texture)
+		self.geometry = QuadGeometry(rect_corners(size, position))
+	
+	# reports are FrameTimers or anything else with a report() method
+	def render(self, camera, *reports):
+		ctx = self.canvas.ctx
+		
+		# painting over the last frame would let its text shine through
+		ctx.set_operator(cairo.OPERATOR_SOURCE)
+		ctx.set_source_rgba(0, 0, 0, 0.8)
+		ctx.rectangle(0, 0, *self.canvas.size)
+		ctx.fill()
+		ctx.set_operator(cairo.OPERATOR_OVER)
+		
+		ctx.set_source_rgb(1, 1, 1)
+		ctx.select_font_face("monospace")
+		issued, skipped = render_state.frame_stats
+		report = "\n\n".join(item.report() for item in reports)
+		report += "\ngl state calls: {} issued, {} skipped".format(issued, skipped)
+		draw_text_multiline(ctx, report, (10, 20), font_size=14)
+		
+		self.canvas.update()
+		camera.render(self.geometry, self.material)
+
 class Window:
 	first_window = None
+	uses_glfw = True
 	
 	def __init__(self, setup, size, title="Window", monitor=None, maximize=False, resizable=False):
 		self.setup = setup
@@ -111,6 +150,10 @@ class Window:
 		self.frame_before = None
 		self.fps_counter = FPSCounter(self, title)
 		self.window = None
+		self.hide_callbacks = []
+		self.timer = FrameTimer()
+		self.scheduler = FrameScheduler(budget=self.timer.budget)
+		self.show_timing = False
 	
 	@property
 	def title(self):
@@ -125,6 +168,8 @@ class Window:
 	
 	def show(self):
 		glfw.window_hint(glfw.RESIZABLE, self.resizable)
+		# stays hidden until shaders and setup are done
+		glfw.window_hint(glfw.VISIBLE, False)
 		
 		self.window = glfw.create_window(*self.size, self._title, None, Window.first_window)
 		if not self.window:
@@ -138,6 +183,9 @@ class Window:
 			print("GLSL Version:", glGetString(GL_SHADING_LANGUAGE_VERSION))
 			print("Renderer:", glGetString(GL_RENDERER))
 			
+			durations = warm_shaders()
+			print("Shaders: {} warmed in {:.1f}ms".format(len(durations), sum(durations.values()) * 1000))
+			
 			Window.first_window = self.window
 		
 		glfw.set_key_callback(self.window, self.on_key)
@@ -150,10 +198,13 @@ class Window:
 				self.wait_until_window_maximized = True
 		
 		self.render = self.setup(window=self)
+		glfw.show_window(self.window)
 	
 	def on_key(self, window, key, scancode, action, mods):
 		if key in [glfw.KEY_Q, glfw.KEY_ESCAPE]:
 			glfw.set_window_should_close(self.window, True)
+		elif key == glfw.KEY_T and action == glfw.PRESS:
+			self.show_timing = not self.show_timing
 	
 	def update(self):
 		if self.window == None:
@@ -167,46 +218,162 @@ class Window:
 			if try_maximize_window():
 				self.wait_until_window_maximized = False
 		
+		self.timer.begin_frame()
+		
 		# wait until window is open and maximized
 		if not self.wait_until_window_maximized:
 			self.framebuffer_size = glfw.get_framebuffer_size(self.window)
 			self.render_content()
 		
-		glfw.swap_buffers(self.window)
+		with self.timer.stage("swap"):
+			glfw.swap_buffers(self.window)
+		
+		duration = self.timer.end_frame()
+		if duration is not None:
+			# swap_buffers waits for vsync, that is not part of the work of a frame
+			self.scheduler.end_frame(duration - self.timer.current.get("swap", 0))
 		
 		return True
 	
+	def close(self):
+		glfw.set_window_should_close(self.window, True)
+	
+	def make_current(self):
+		glfw.make_context_current(self.window)
+	
+	def on_hide(self, callback):
+		self.hide_callbacks.append(callback)
+	
 	def hide(self):
+		for callback in self.hide_callbacks:
+			callback()
+		
 		glfw.destroy_window(self.window)
 		self.window = None
 	
 	def render_content(self):
-		glfw.make_context_current(self.window)
+		self.make_current()
+		render_state.begin_frame()
 		
-		frame_start = time.time()
+		frame_start = clock.now()
 		delta_time = frame_start - self.frame_before if self.frame_before != None else 0
 		self.frame_before = frame_start
 		
-		self.fps_counter.update(frame_start)
+		self.fps_counter.update(time.time())
 		
 		self.render(frame_start=frame_start,
 			delta_time=delta_time,
 			window=self)
 
-def run(*windows):
-	if not glfw.init():
-		raise Exception("can't initialize glfw")
+# renders into a framebuffer object of an egl or osmesa context instead of a glfw
+# window, see cyberdesk.offscreen. stops after max_frames if it is set.
+class OffscreenWindow(Window):
+	uses_glfw = False
+	
+	def __init__(self, setup, size, title="Offscreen", max_frames=None):
+		super().__init__(setup, size, title=title)
+		self.max_frames = max_frames
+		self.rendered_frames = 0
+		self.should_close = False
+		self.framebuffer = None
+		self.renderbuffers = None
+	
+	@Window.title.setter
+	def title(self, title):
+		self._title = title
 	
-	if os.path.exists("gamecontrollerdb.txt"):
-		with open("gamecontrollerdb.txt", "r") as file:
-			gamecontrollerdb = file.read()
-			glfw.update_gamepad_mappings(gamecontrollerdb)
+	def show(self):
+		self.window = offscreen_context()
+		self.window.make_current()
+		
+		if Window.first_window == None:
+			print("Vendor:", glGetString(GL_VENDOR))
+			print("OpenGL Version:", glGetString(GL_VERSION))
+			print("Renderer:", glGetString(GL_RENDERER))
+			warm_shaders()
+			Window.first_window = self.window
+		
+		self.framebuffer = glGenFramebuffers(1)
+		self.renderbuffers = glGenRenderbuffers(2)
+		glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffer)
+		
+		for renderbuffer, internal_format, attachment in zip(self.renderbuffers,
+			[GL_RGBA8, GL_DEPTH24_STENCIL8], [GL_COLOR_ATTACHMENT0, GL_DEPTH_STENCIL_ATTACHMENT]):
+			glBindRenderbuffer(GL_RENDERBUFFER, renderbuffer)
+			glRenderbufferStorage(GL_RENDERBUFFER, internal_format, *self.size)
+			glFramebufferRenderbuffer(GL_FRAMEBUFFER, attachment, GL_RENDERBUFFER, renderbuffer)
+		
+		glBindRenderbuffer(GL_RENDERBUFFER, 0)
+		if glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE:
+			raise Exception("offscreen framebuffer is incomplete")
+		
+		self.render = self.setup(window=self)
+	
+	def close(self):
+		self.should_close = True
 	
-	glfw.window_hint(glfw.CONTEXT_VERSION_MAJOR, 3) # 3.2 or 4.1
-	glfw.window_hint(glfw.CONTEXT_VERSION_MINOR, 2)
-	glfw.window_hint(glfw.OPENGL_FORWARD_COMPAT, 1)
-	glfw.window_hint(glfw.OPENGL_PROFILE, glfw.OPENGL_CORE_PROFILE)
-	glfw.window_hint(glfw.COCOA_RETINA_FRAMEBUFFER, False)
+	def make_current(self):
+		self.window.make_current()
+		glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffer)
+	
+	def update(self):
+		if self.window == None:
+			return False
+		
+		if self.should_close or (self.max_frames is not None and self.rendered_frames >= self.max_frames):
+			self.hide()
+			return False
+		
+		self.timer.begin_frame()
+		self.render_content()
+		
+		# there is no swap, wait for the gpu so frame times include the draw cost
+		with self.timer.stage("swap"):
+			glFinish()
+		
+		self.scheduler.end_frame(self.timer.end_frame())
+		self.rendered_frames += 1
+		
+		return True
+	
+	# returns the last rendered frame as a (height, width, channels) array, top row first
+	def read_frame(self, format=GL_RGB):
+		self.make_current()
+		glPixelStorei(GL_PACK_ALIGNMENT, 1)
+		
+		channels = 4 if format in (GL_RGBA, GL_BGRA) else 3
+		data = glReadPixels(0, 0, *self.size, format, GL_UNSIGNED_BYTE)
+		frame = np.frombuffer(data, dtype=np.uint8).reshape(self.size[1], self.size[0], channels)
+		return np.ascontiguousarray(frame[::-1])
+	
+	def hide(self):
+		for callback in self.hide_callbacks:
+			callback()
+		
+		self.window.make_current()
+		glDeleteFramebuffers(1, [self.framebuffer])
+		glDeleteRenderbuffers(2, self.renderbuffers)
+		self.framebuffer = None
+		self.renderbuffers = None
+		self.window = None
+
+def run(*windows):
+	uses_glfw = any(window.uses_glfw for window in windows)
+	
+	if uses_glfw:
+		if not glfw.init():
+			raise Exception("can't initialize glfw")
+		
+		if os.path.exists("gamecontrollerdb.txt"):
+			with open("gamecontrollerdb.txt", "r") as file:
+				gamecontrollerdb = file.read()
+				glfw.update_gamepad_mappings(gamecontrollerdb)
+		
+		glfw.window_hint(glfw.CONTEXT_VERSION_MAJOR, 3) # 3.2 or 4.1
+		glfw.window_hint(glfw.CONTEXT_VERSION_MINOR, 2)
+		glfw.window_hint(glfw.OPENGL_FORWARD_COMPAT, 1)
+		glfw.window_hint(glfw.OPENGL_PROFILE, glfw.OPENGL_CORE_PROFILE)
+		glfw.window_hint(glfw.COCOA_RETINA_FRAMEBUFFER, False)
 	
 	for window in windows:
 		window.show()
@@ -218,12 +385,17 @@ def run(*windows):
 			for window in windows:
 				windows_open |= window.update()
 			
-			glfw.poll_events()
+			if uses_glfw:
+				glfw.poll_events()
 	except KeyboardInterrupt:
-		for window in windows:
-			glfw.set_window_should_close(window.window, True)
+		pass
 	
-	glfw.terminate()
+	for window in windows:
+		if window.window != None:
+			window.hide()
+	
+	if uses_glfw:
+		glfw.terminate()
 
 def projection(*args, **kwargs):
 	import _config as config
@@ -244,7 +416,13 @@ def window(**kwargs):
 def create_projection_window(setup,
 	projection_size=(1280, 720), camera_size=(1280, 720),
 	monitor_name=None, maximize_window=True, camera_id=0,
-	load_calibration=True):
+	load_calibration=True, vision_worker=False,
+	record=None, replay=None, replay_realtime=True, offscreen=False,
+	vision_thread=True):
+	
+	# only CameraStream records
+	if record is not None and (vision_worker or replay is not None):
+		raise Exception("record can't be combined with vision_worker or replay")
 	
 	projection_rect = rect_corners(size=projection_size)
 	
@@ -255,7 +433,31 @@ def create_projection_window(setup,
 		perspective_transform = None
 	
 	def setup_decorator(window, **kwargs):
-		capture = get_camera_capture(*camera_size, camera_id=camera_id)
+		# with vision_worker, capture and marker detection run in a separate process
+		# and the render callback gets the detected markers as marker_detections
+		if replay is not None:
+			stream = ReplayStream(replay, realtime=replay_realtime).start()
+		elif vision_worker:
+			stream = VisionWorker(camera_size, camera_id=camera_id).start()
+		else:
+			recorder = SessionRecorder(record) if record is not None else None
+			stream = CameraStream(get_camera_capture(*camera_size, camera_id=camera_id), recorder=recorder).start()
+		
+		# setups that call vision.start() process camera frames on their own thread at
+		# camera rate and render every display frame from the latest marker snapshot.
+		# replays that are not realtime run in lockstep, one camera frame per render
+		# frame, so every run sees the same frames in the same order.
+		lockstep = replay is not None and not replay_realtime
+		# detection has the time between two camera frames, streams that don't know their
+		# frame rate get the default of DetectionScheduler
+		fps = getattr(stream, "fps", None)
+		detection_scheduler = DetectionScheduler(budget=1 / fps) if fps else DetectionScheduler()
+		vision = VisionLoop(stream, scheduler=detection_scheduler) if vision_thread and not lockstep else None
+		if vision is not None:
+			window.on_hide(vision.stop)
+		
+		window.on_hide(stream.stop)
+		
 		camera = OrtographicCamera(*ortographic_camera_params(window.framebuffer_size))
 		
 		context = dict(
@@ -264,24 +466,85 @@ def create_projection_window(setup,
 			projection_rect=projection_rect,
 			perspective_transform=perspective_transform,
 			camera=camera,
+			camera_stream=stream,
+			timer=window.timer,
+			# the schedulers decide by frame times, lockstep replays must not depend on them
+			scheduler=window.scheduler if not lockstep else None,
+			detection_scheduler=vision.scheduler if vision is not None else None,
+			vision=vision,
 		)
 		
 		render = setup(window=window, **context, **kwargs)
+		overlay = None
+		converted_sequence = None
 		
 		def render_decorator(**kwargs):
-			camera_frame, camera_frame_gray = get_camera_frame(capture)
+			nonlocal overlay, converted_sequence
+			
+			if vision is not None and vision.started:
+				with window.timer.stage("snapshot"):
+					snapshot = vision.markers.acquire(timeout=10)
+				
+				if vision.exception is not None:
+					raise vision.exception
+				
+				if vision.finished:
+					window.close()
+					return
+				elif snapshot is None:
+					raise Exception("can't read camera frame")
+				
+				camera_frame, camera_frame_gray = snapshot.frame, snapshot.gray
+				camera_timestamp, camera_frame_sequence = snapshot.timestamp, snapshot.sequence
+				marker_detections = None
+			else:
+				with window.timer.stage("capture"):
+					result = stream.read()
+				
+				if result is None and getattr(stream, "error", None) is not None:
+					raise stream.error
+				elif result is None and getattr(stream, "finished", False):
+					window.close()
+					return
+				elif result is None:
+					raise Exception("can't read camera frame")
+				
+				camera_frame, camera_frame_gray, camera_timestamp, camera_frame_sequence = result[:4]
+				marker_detections = result[4:] if len(result) > 4 else None
+			
+			# gray conversion runs on the capture thread, report its duration once per camera frame
+			if getattr(stream, "conversion_time", None) is not None and camera_frame_sequence != converted_sequence:
+				window.timer.add("convert", stream.conversion_time)
+				converted_sequence = camera_frame_sequence
 			
 			camera.update(*ortographic_camera_params(window.framebuffer_size))
 			camera.clear_frame()
 			
-			return render(
+			result = render(
 				camera_frame=camera_frame,
 				camera_frame_gray=camera_frame_gray,
+				camera_timestamp=camera_timestamp,
+				camera_frame_sequence=camera_frame_sequence,
+				marker_detections=marker_detections,
 				**context,
 				**kwargs)
+			
+			# press T to show the stage timings on the projection
+			if window.show_timing:
+				if overlay is None:
+					overlay = TimingOverlay()
+				reports = [window.timer, vision.timer] if vision is not None and vision.started else [window.timer]
+				schedulers = [window.scheduler, vision.scheduler] if vision is not None and vision.started else [window.scheduler]
+				overlay.render(camera, *reports, *schedulers)
+			
+			return result
 		
 		return render_decorator
 	
+	# offscreen projections are mostly useful with replay, they need no display
+	if offscreen:
+		return OffscreenWindow(setup_decorator, size=projection_size, title="Projection")
+	
 	return Window(setup_decorator,
 		size=projection_size, title="Projection",
 		monitor=monitor_name, maximize=maximize_window)
@@ -0,0 +1,206 @@
+import numpy as np
+import cv2 as cv
+import time
+from cyberdesk.vision import get_marker_images
+from cyberdesk.math import rect_corners, centered_rect_corners
+from cyberdesk.paperspace import Paper
+from cyberdesk.paperspace.shapes import RectShape, SingleShape
+from cyberdesk.clock import set_clock, reset_clock
+
+PAGE_SIZE_MM = (210, 297)
+PAGE_BORDER_MM = 10
+PAGE_MARKER_SIZE_MM = 30
+
+def percentiles(times, percentiles=(50, 95, 99)):
+	if len(times) == 0:
+		return [0 for _ in percentiles]
+	
+	return list(np.percentile(times, percentiles))
+
+def rect_paper_image(marker_ids, width):
+	mm = width / PAGE_SIZE_MM[0]
+	height = int(PAGE_SIZE_MM[1] * mm)
+	border = int(PAGE_BORDER_MM * mm)
+	marker_size = int(PAGE_MARKER_SIZE_MM * mm)
+	
+	page = np.full((height, width), 255, dtype=np.uint8)
+	positions = [
+		(border, border),
+		(width - marker_size - border, border),
+		(width - marker_size - border, height - marker_size - border),
+		(border, height - marker_size - border),
+	]
+	
+	# markers are rotated like in cyberdesk.paperspace.printing
+	for rot90, (marker, (x, y)) in enumerate(zip(get_marker_images(*marker_ids, size=marker_size), positions)):
+		page[y:y+marker_size, x:x+marker_size] = np.rot90(marker, rot90, axes=(1, 0))
+	
+	return page
+
+def single_paper_image(marker_id, width):
+	marker_size = int(width * 0.7)
+	border = (width - marker_size) // 2
+	page = np.full((width, width), 255, dtype=np.uint8)
+	page[border:border+marker_size, border:border+marker_size] = get_marker_images(marker_id, size=marker_size)[0]
+	return page
+
+def background_image(size, filename=None, seed=0):
+	if filename is not None:
+		image = cv.imread(filename, cv.IMREAD_GRAYSCALE)
+		return cv.resize(image, size)
+	
+	# low frequency noise that looks like a wooden desk from far away
+	random = np.random.default_rng(seed)
+	small = random.integers(60, 140, size=(size[1] // 32 + 1, size[0] // 32 + 1), dtype=np.uint8)
+	return cv.resize(small, size, interpolation=cv.INTER_CUBIC)
+
+class SyntheticPaper:
+	def __init__(self, image, position, rotation, skew, velocity, angular_velocity):
+		self.image = image
+		self.position = position
+		self.rotation = rotation
+		self.skew = skew
+		self.velocity = velocity
+		self.angular_velocity = angular_velocity
+	
+	@property
+	def size(self):
+		return np.array([self.image.shape[1], self.image.shape[0]])
+	
+	def corners(self):
+		return centered_rect_corners(self.position, self.size, self.rotation) + self.skew
+	
+	def move(self, desk_size, dt):
+		self.position = self.position + self.velocity * dt
+		self.rotation = (self.rotation + self.angular_velocity * dt) % 360
+		
+		# bounce off the edges of the desk
+		margin = self.size.max() / 2
+		for axis in range(2):
+			if self.position[axis] < margin or self.position[axis] > desk_size[axis] - margin:
+				self.velocity[axis] = -self.velocity[axis]
+				self.position[axis] = np.clip(self.position[axis], margin, desk_size[axis] - margin)
+
+# renders camera frames of a desk with printed papers on it, papers are a list of
+# marker id lists like the "markers" entries of papers.json
+class SyntheticDesk:
+	def __init__(self, size, papers, background=None, paper_width=None,
+		noise=4, moving=0.2, speed=80, perspective=0.03, seed=0):
+		self.size = size
+		self.noise = noise
+		self.random = np.random.default_rng(seed)
+		self.background = background_image(size, background, seed)
+		
+		paper_width = paper_width if paper_width is not None else size[0] // 10
+		
+		columns = int(np.ceil(np.sqrt(len(papers) * size[0] / size[1]))) if papers else 1
+		rows = int(np.ceil(len(papers) / columns)) if papers else 1
+		cell = np.array([size[0] / columns, size[1] / rows])
+		
+		self.papers = []
+		for index, marker_ids in enumerate(papers):
+			if len(marker_ids) == 4:
+				image = rect_paper_image(marker_ids, paper_width)
+			else:
+				image = single_paper_image(marker_ids[0], paper_width // 2)
+			
+			# jittered grid, so papers rarely overlap
+			grid_position = np.array([index % columns + 0.5, index // columns + 0.5]) * cell
+			position = grid_position + self.random.uniform(-0.1, 0.1, 2) * cell
+			rotation = self.random.uniform(0, 360)
+			skew = self.random.uniform(-perspective, perspective, (4, 2)) * paper_width
+			
+			if self.random.uniform() < moving:
+				direction = self.random.uniform(0, 2*np.pi)
+				velocity = np.array([np.cos(direction), np.sin(direction)]) * speed
+				angular_velocity = self.random.uniform(-30, 30)
+			else:
+				velocity = np.zeros(2)
+				angular_velocity = 0
+			
+			self.papers.append(SyntheticPaper(image, position, rotation, skew.astype(np.float32), velocity, angular_velocity))
+	
+	def render(self, dt=0):
+		frame = self.background.copy()
+		
+		for paper in self.papers:
+			paper.move(self.size, dt)
+			
+			height, width = paper.image.shape
+			transform = cv.getPerspectiveTransform(rect_corners((width, height)), paper.corners().astype(np.float32))
+			cv.warpPerspective(paper.image, transform, self.size, dst=frame,
+				flags=cv.INTER_LINEAR, borderMode=cv.BORDER_TRANSPARENT)
+		
+		if self.noise > 0:
+			noise = self.random.normal(0, self.noise, frame.shape)
+			frame = np.clip(frame + noise, 0, 255).astype(np.uint8)
+		
+		return frame
+
+class BenchmarkPaper(Paper):
+	def __init__(self, shape):
+		super().__init__(shape)
+		self.shows = 0
+		self.updates = 0
+		self.hides = 0
+	
+	def show(self):
+		self.shows += 1
+	
+	def update(self):
+		self.updates += 1
+	
+	def hide(self):
+		self.hides += 1
+
+def benchmark_paper(data, markers):
+	if len(data["markers"]) == 4:
+		shape = RectShape(markers.get_all(*data["markers"]))
+	else:
+		shape = SingleShape(markers.get(data["markers"][0]), absent_after=1)
+	
+	return BenchmarkPaper(shape)
+
+def synthetic_papers_json(count, papers=[]):
+	papers = list(papers[:count])
+	used = set(marker for paper in papers for marker in paper["markers"])
+	free = [marker for marker in range(250) if marker not in used]
+	next_id = max([paper["id"] for paper in papers], default=0) + 1
+	
+	while len(papers) < count and len(free) >= 4:
+		papers.append({ "id": next_id, "type": "benchmark", "markers": free[:4] })
+		free = free[4:]
+		next_id += 1
+	
+	return papers
+
+# runs frames through detection, MarkerTracker and Space.update and returns the
+# durations of each stage in seconds. shapes and papers run on the time of the
+# synthetic camera.
+def run_pipeline(frames, detect, tracker, space, fps=30):
+	stages = { "detect": [], "tracker": [], "space": [], "total": [] }
+	timestamp = [0]
+	set_clock(lambda: timestamp[0])
+	
+	try:
+		for frame in frames:
+			timestamp[0] += 1 / fps
+			start = time.perf_counter()
+			
+			corners, ids = detect(frame)
+			detected = time.perf_counter()
+			
+			tracker.process_frame(corners, ids, timestamp=timestamp[0])
+			tracked = time.perf_counter()
+			
+			space.update()
+			updated = time.perf_counter()
+			
+			stages["detect"].append(detected - start)
+			stages["tracker"].append(tracked - detected)
+			stages["space"].append(updated - tracked)
+			stages["total"].append(updated - start)
+	finally:
+		reset_clock()
+	
+	return { name: np.array(times) for name, times in stages.items() }
@@ -0,0 +1,15 @@
+import time
+
+# time source for everything that depends on the camera, replays of recorded
+# sessions replace it with the time of the recording
+clock = time.time
+
+def now():
+	return clock()
+
+def set_clock(fn):
+	global clock
+	clock = fn
+
+def reset_clock():
+	set_clock(time.time)
@@ -1,12 +1,116 @@
 from OpenGL.GL import *
+from OpenGL.error import GLError
 import numpy as np
+import ctypes
+import zlib
+import hashlib
+import struct
+import time
+import os
 import cairo
-from PIL import Image
-from cyberdesk.math import line_intersection, distance
+from cyberdesk.math import line_intersection, distance, merge_rects
+from cyberdesk.images import load_image
 from functools import cache, lru_cache
 
 ATTRIBUTE_LOCATION_POSITIONS = 0
 ATTRIBUTE_LOCATION_TEXTUREUV = 1
+ATTRIBUTE_LOCATION_COLOR = 2
+
+# remembers the bound program, vertex array, textures and uniform values and skips
+# gl calls that wouldn't change anything. code that calls gl directly has to call
+# invalidate() afterwards. bindings are invalidated at the start of every frame,
+# uniform values are stored in the program objects and survive frames.
+class RenderState:
+	def __init__(self):
+		self.uniforms = {}
+		self.issued = 0
+		self.skipped = 0
+		self.frame_stats = (0, 0)
+		self.invalidate()
+	
+	def invalidate(self, uniforms=False):
+		self.program = None
+		self.vertex_array = None
+		self.active_unit = None
+		self.textures = {}
+		
+		if uniforms:
+			self.uniforms = {}
+	
+	# deleted names are reused by gl, so they must not stay in the cache
+	def forget_texture(self, texture):
+		for unit, bound in list(self.textures.items()):
+			if bound == texture:
+				del self.textures[unit]
+	
+	def forget_program(self, program):
+		if self.program == program:
+			self.program = None
+		
+		for key in [key for key in self.uniforms if key[0] == program]:
+			del self.uniforms[key]
+	
+	def begin_frame(self):
+		self.frame_stats = (self.issued, self.skipped)
+		self.issued = 0
+		self.skipped = 0
+		self.invalidate()
+	
+	def changed(self, changed):
+		if changed:
+			self.issued += 1
+		else:
+			self.skipped += 1
+		
+		return changed
+	
+	def use_program(self, program):
+		if self.changed(self.program != program):
+			glUseProgram(program)
+			self.program = program
+	
+	def bind_vertex_array(self, vertex_array):
+		if self.changed(self.vertex_array != vertex_array):
+			glBindVertexArray(vertex_array)
+			self.vertex_array = vertex_array
+	
+	def active_texture(self, unit):
+		if self.changed(self.active_unit != unit):
+			glActiveTexture(GL_TEXTURE0 + unit)
+			self.active_unit = unit
+	
+	# binds to the given unit, or to the active unit if unit is None
+	def bind_texture(self, texture, unit=None):
+		if unit is not None:
+			self.active_texture(unit)
+		
+		if self.changed(self.active_unit is None or self.textures.get(self.active_unit) != texture):
+			glBindTexture(GL_TEXTURE_2D, texture)
+			if self.active_unit is not None:
+				self.textures[self.active_unit] = texture
+	
+	# the program of the uniform has to be in use
+	def uniform_1i(self, location, value):
+		key = (self.program, location)
+		if self.changed(self.uniforms.get(key) != value):
+			glUniform1i(location, value)
+			self.uniforms[key] = value
+	
+	def uniform_4f(self, location, values):
+		key = (self.program, location)
+		values = tuple(values)
+		if self.changed(self.uniforms.get(key) != values):
+			glUniform4f(location, *values)
+			self.uniforms[key] = values
+	
+	def uniform_matrix_4fv(self, location, matrix):
+		key = (self.program, location)
+		cached = self.uniforms.get(key)
+		if self.changed(cached is None or not np.array_equal(cached, matrix)):
+			glUniformMatrix4fv(location, 1, GL_FALSE, matrix)
+			self.uniforms[key] = np.array(matrix, copy=True)
+
+render_state = RenderState()
 
 class Texture:
 	def __init__(self, size, data=None,
@@ -22,20 +126,18 @@ class Texture:
 		
 		self.texture = glGenTextures(1)
 		glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
-		glBindTexture(GL_TEXTURE_2D, self.texture)
+		render_state.bind_texture(self.texture)
 		
 		glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, wrap_s)
 		glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, wrap_t)
 		glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, min_filter)
 		glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, mag_filter)
 		
-		glBindTexture(GL_TEXTURE_2D, 0)
-		
 		if data is not None:
 			self.update(data)
 	
 	def update(self, data):
-		glBindTexture(GL_TEXTURE_2D, self.texture)
+		render_state.bind_texture(self.texture)
 		
 		if self.size_initialized:
 			glTexSubImage2D(
@@ -60,18 +162,155 @@ class Texture:
 				data # data
 			)
 			self.size_initialized = True
-		
-		glBindTexture(GL_TEXTURE_2D, 0)
+	
+	# data is the pixels of the region only, the texture has to be initialized
+	def update_region(self, data, x, y, width, height):
+		render_state.bind_texture(self.texture)
+		glTexSubImage2D(GL_TEXTURE_2D, 0, x, y, width, height, self.format, self.type, data)
+	
+	def generate_mipmaps(self):
+		render_state.bind_texture(self.texture)
+		glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
+		glGenerateMipmap(GL_TEXTURE_2D)
 	
 	def draw(self, corners, uvs=[(0, 0), (0, 1), (1, 1), (1, 0)]):
 		draw_texture(self.texture, corners, uvs=uvs)
 	
 	def __del__(self):
 		try:
+			render_state.forget_texture(self.texture)
 			glDeleteTextures([self.texture])
 		except:
 			pass
 
+# uploads through a ring of pixel buffer objects, so glTexSubImage2D returns right away
+# and the copy to the texture runs on the gpu while the cpu fills the next buffer.
+# with persistent=True (needs glBufferStorage, opengl 4.4) the buffers are mapped once
+# and fences make sure a buffer is not overwritten while the gpu still reads from it.
+class StreamingTexture(Texture):
+	def __init__(self, size, data=None, buffer_count=3, persistent=None, **kwargs):
+		self.buffer_count = buffer_count
+		self.buffer_index = 0
+		self.buffer_size = None
+		self.buffers = None
+		self.mapping = None
+		self.fences = [None] * buffer_count
+		
+		if persistent is None:
+			persistent = persistent_mapping_supported()
+		self.persistent = persistent
+		
+		super().__init__(size, data, **kwargs)
+	
+	def allocate_buffers(self, nbytes):
+		self.buffer_size = nbytes
+		
+		if self.persistent:
+			flags = GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+			self.buffers = [glGenBuffers(1)]
+			glBindBuffer(GL_PIXEL_UNPACK_BUFFER, self.buffers[0])
+			glBufferStorage(GL_PIXEL_UNPACK_BUFFER, nbytes * self.buffer_count, None, flags)
+			self.mapping = pointer_address(glMapBufferRange(GL_PIXEL_UNPACK_BUFFER, 0, nbytes * self.buffer_count, flags))
+		else:
+			self.buffers = list(np.atleast_1d(glGenBuffers(self.buffer_count)))
+			for buffer in self.buffers:
+				glBindBuffer(GL_PIXEL_UNPACK_BUFFER, buffer)
+				glBufferData(GL_PIXEL_UNPACK_BUFFER, nbytes, None, GL_STREAM_DRAW)
+		
+		glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+		
+		# allocate the texture storage once, all later uploads go through the buffers
+		render_state.bind_texture(self.texture)
+		glTexImage2D(GL_TEXTURE_2D, 0, self.internal_format, *self.size, 0, self.format, self.type, None)
+		self.size_initialized = True
+	
+	def write_buffer(self, data):
+		# a bigger frame would be written past the end of the mapped buffer
+		if data.nbytes != self.buffer_size:
+			raise Exception("frame has {} bytes, the texture buffers {}".format(data.nbytes, self.buffer_size))
+		
+		index = self.buffer_index
+		self.buffer_index = (index + 1) % self.buffer_count
+		
+		if self.persistent:
+			if self.fences[index] is not None:
+				glClientWaitSync(self.fences[index], GL_SYNC_FLUSH_COMMANDS_BIT, 1000000000)
+				glDeleteSync(self.fences[index])
+				self.fences[index] = None
+			
+			offset = index * self.buffer_size
+			ctypes.memmove(self.mapping + offset, data.ctypes.data, data.nbytes)
+			glBindBuffer(GL_PIXEL_UNPACK_BUFFER, self.buffers[0])
+			return index, offset
+		
+		# the ring gives the gpu buffer_count - 1 frames to finish reading this buffer
+		glBindBuffer(GL_PIXEL_UNPACK_BUFFER, self.buffers[index])
+		pointer = glMapBufferRange(GL_PIXEL_UNPACK_BUFFER, 0, self.buffer_size,
+			GL_MAP_WRITE_BIT | GL_MAP_INVALIDATE_BUFFER_BIT)
+		ctypes.memmove(pointer_address(pointer), data.ctypes.data, data.nbytes)
+		glUnmapBuffer(GL_PIXEL_UNPACK_BUFFER)
+		return index, 0
+	
+	def update(self, data):
+		data = np.ascontiguousarray(data)
+		
+		if self.buffers is None:
+			self.allocate_buffers(pixel_data_size(self.size, self.format, self.type) or data.nbytes)
+		
+		index, offset = self.write_buffer(data)
+		
+		render_state.bind_texture(self.texture)
+		glTexSubImage2D(GL_TEXTURE_2D, 0, 0, 0, *self.size, self.format, self.type, ctypes.c_void_p(offset))
+		
+		if self.persistent:
+			self.fences[index] = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+		
+		glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+	
+	def __del__(self):
+		try:
+			if self.buffers is not None:
+				if self.persistent:
+					glBindBuffer(GL_PIXEL_UNPACK_BUFFER, self.buffers[0])
+					glUnmapBuffer(GL_PIXEL_UNPACK_BUFFER)
+					glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+				glDeleteBuffers(len(self.buffers), self.buffers)
+		except:
+			pass
+		
+		super().__del__()
+
+FORMAT_COMPONENTS = { GL_RED: 1, GL_RG: 2, GL_RGB: 3, GL_BGR: 3, GL_RGBA: 4, GL_BGRA: 4 }
+TYPE_SIZES = { GL_UNSIGNED_BYTE: 1, GL_BYTE: 1, GL_UNSIGNED_SHORT: 2, GL_SHORT: 2,
+	GL_HALF_FLOAT: 2, GL_UNSIGNED_INT: 4, GL_INT: 4, GL_FLOAT: 4 }
+PACKED_TYPE_SIZES = { GL_UNSIGNED_INT_8_8_8_8: 4, GL_UNSIGNED_INT_8_8_8_8_REV: 4 }
+
+# bytes of tightly packed pixels of size, None for formats not in the tables
+def pixel_data_size(size, format, type):
+	if type in PACKED_TYPE_SIZES:
+		pixel_size = PACKED_TYPE_SIZES[type]
+	elif format in FORMAT_COMPONENTS and type in TYPE_SIZES:
+		pixel_size = FORMAT_COMPONENTS[format] * TYPE_SIZES[type]
+	else:
+		return None
+	
+	return size[0] * size[1] * pixel_size
+
+def pointer_address(pointer):
+	if isinstance(pointer, int):
+		return pointer
+	
+	return ctypes.cast(pointer, ctypes.c_void_p).value
+
+@cache
+def persistent_mapping_supported():
+	version = glGetString(GL_VERSION)
+	if version is None:
+		return False
+	
+	major, minor = [int(v) for v in version.split()[0].split(b".")[:2]]
+	return (major, minor) >= (4, 4) and bool(glBufferStorage)
+
 class SubShader:
 	def __init__(self, shader_type, code):
 		self.shader = glCreateShader(shader_type)
@@ -88,9 +327,104 @@ class SubShader:
 		if self.shader != None:
 			glDeleteShader(self.shader)
 
+# linked programs are stored with glGetProgramBinary, keyed by the shader sources and
+# the driver. binaries of another driver version fail to load and are recompiled.
+SHADER_CACHE_DIR = os.environ.get("CYBERDESK_SHADER_CACHE",
+	os.path.join(os.path.expanduser("~"), ".cache", "cyberdesk", "shaders"))
+
+@cache
+def program_binary_supported():
+	try:
+		return bool(glProgramBinary) and glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS) > 0
+	except Exception:
+		return False
+
+def program_cache_path(vertex_shader_code, fragment_shader_code):
+	digest = hashlib.sha1()
+	for value in (glGetString(GL_VENDOR), glGetString(GL_RENDERER), glGetString(GL_VERSION)):
+		digest.update(value or b"")
+		digest.update(b"\0")
+	
+	for code in (vertex_shader_code, fragment_shader_code):
+		digest.update(code.encode("utf-8"))
+		digest.update(b"\0")
+	
+	return os.path.join(SHADER_CACHE_DIR, digest.hexdigest() + ".bin")
+
+def load_program_binary(program, path):
+	try:
+		with open(path, "rb") as file:
+			data = file.read()
+	except OSError:
+		return False
+	
+	if len(data) <= 4:
+		return False
+	
+	binary_format, = struct.unpack_from("<I", data)
+	binary = np.frombuffer(data, dtype=np.uint8, offset=4)
+	
+	# drivers reject formats they don't know with GL_INVALID_ENUM
+	try:
+		glProgramBinary(program, binary_format, binary, len(binary))
+		linked = glGetProgramiv(program, GL_LINK_STATUS) == GL_TRUE
+	except GLError:
+		linked = False
+	
+	if not linked:
+		try:
+			os.remove(path)
+		except OSError:
+			pass
+	
+	return linked
+
+def save_program_binary(program, path):
+	size = glGetProgramiv(program, GL_PROGRAM_BINARY_LENGTH)
+	if size <= 0:
+		return
+	
+	length = np.zeros(1, dtype=np.int32)
+	binary_format = np.zeros(1, dtype=np.uint32)
+	binary = np.zeros(size, dtype=np.uint8)
+	glGetProgramBinary(program, size, length, binary_format, binary)
+	
+	try:
+		os.makedirs(SHADER_CACHE_DIR, exist_ok=True)
+		temp_path = "{}.{}.tmp".format(path, os.getpid())
+		with open(temp_path, "wb") as file:
+			file.write(struct.pack("<I", int(binary_format[0])))
+			file.write(binary[:int(length[0])].tobytes())
+		os.replace(temp_path, path)
+	except OSError as e:
+		print("can't write shader cache:", e)
+
 class Shader:
-	def __init__(self, vertex_shader_code, fragment_shader_code):
+	def __init__(self, vertex_shader_code, fragment_shader_code, cache=True):
 		self.program = glCreateProgram()
+		self.vertex_shader = None
+		self.fragment_shader = None
+		self.from_cache = False
+		
+		cache_path = None
+		if cache and program_binary_supported():
+			cache_path = program_cache_path(vertex_shader_code, fragment_shader_code)
+			self.from_cache = load_program_binary(self.program, cache_path)
+			
+			if not self.from_cache:
+				# a failed glProgramBinary leaves the program unusable
+				render_state.forget_program(self.program)
+				glDeleteProgram(self.program)
+				self.program = glCreateProgram()
+				glProgramParameteri(self.program, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
+		
+		if not self.from_cache:
+			self.compile(vertex_shader_code, fragment_shader_code)
+			
+			if cache_path is not None:
+				save_program_binary(self.program, cache_path)
+	
+	def compile(self, vertex_shader_code, fragment_shader_code):
 		self.vertex_shader = SubShader(GL_VERTEX_SHADER, vertex_shader_code)
 		self.fragment_shader = SubShader(GL_FRAGMENT_SHADER, fragment_shader_code)
 		
@@ -100,6 +434,7 @@ class Shader:
 		
 		if glGetProgramiv(self.program, GL_LINK_STATUS) != GL_TRUE:
 			error = glGetProgramInfoLog(self.program)
+			render_state.forget_program(self.program)
 			glDeleteProgram(self.program)
 			self.program = None
 			raise Exception("program link error: " + str(error))
@@ -113,15 +448,37 @@ class Shader:
 		return glGetAttribLocation(self.program, name)
 	
 	def __enter__(self):
-		glUseProgram(self.program)
+		render_state.use_program(self.program)
 	
+	# the program stays in use, the next draw call usually needs it again
 	def __exit__(self, type, value, traceback):
-		glUseProgram(0)
+		pass
 	
 	def __del__(self):
 		if self.program != None:
+			render_state.forget_program(self.program)
 			glDeleteProgram(self.program)
 
+shader_factories = []
+
+# caches the shader of a factory function and registers it for warm_shaders()
+def shader_factory(fn):
+	fn = cache(fn)
+	shader_factories.append(fn)
+	return fn
+
+# creates the shaders of all registered factories, call it with a current context
+# before the first frame. returns { name: seconds }
+def warm_shaders(*factories):
+	durations = {}
+	
+	for factory in [*shader_factories, *factories]:
+		start = time.perf_counter()
+		factory()
+		durations[factory.__name__] = time.perf_counter() - start
+	
+	return durations
+
 def ortographic_camera_params(size):
 	return 0, *size, 0, -1.0, 1.0
 
@@ -170,7 +527,7 @@ class OrtographicCamera:
 		
 		with material:
 			with geometry:
-				glUniformMatrix4fv(material.shader.uniform_location("matrix"), 1, GL_FALSE, matrix)
+				render_state.uniform_matrix_4fv(material.shader.uniform_location("matrix"), matrix)
 				geometry.draw()
 
 class Material:
@@ -192,18 +549,13 @@ class Material:
 	def __enter__(self):
 		self.shader.__enter__()
 		
-		glUniform4f(self.shader.uniform_location("color"), *self.color)
+		render_state.uniform_4f(self.shader.uniform_location("color"), self.color)
 		
 		for index, (name, texture) in enumerate(self.textures.items()):
-			glUniform1i(self.shader.uniform_location(name), index)
-			glActiveTexture(GL_TEXTURE0 + index)
-			glBindTexture(GL_TEXTURE_2D, texture.texture)
+			render_state.uniform_1i(self.shader.uniform_location(name), index)
+			render_state.bind_texture(texture.texture, unit=index)
 	
 	def __exit__(self, type, value, traceback):
-		for index in range(len(self.textures)):
-			glActiveTexture(GL_TEXTURE0 + index)
-			glBindTexture(GL_TEXTURE_2D, 0)
-		
 		self.shader.__exit__(type, value, traceback)
 
 class Geometry:
@@ -213,7 +565,7 @@ class Geometry:
 		self.indices = indices
 		
 		self.vao = glGenVertexArrays(1)
-		glBindVertexArray(self.vao)
+		render_state.bind_vertex_array(self.vao)
 		
 		self.position_buffer, self.texcoord_buffer, self.index_buffer = glGenBuffers(3)
 		
@@ -230,7 +582,7 @@ class Geometry:
 		glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.index_buffer)
 		glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices, GL_STATIC_DRAW)
 		
-		glBindVertexArray(0)
+		render_state.bind_vertex_array(0)
 		glBindBuffer(GL_ARRAY_BUFFER, 0)
 		glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
 	
@@ -246,18 +598,18 @@ class Geometry:
 			glBindBuffer(GL_ARRAY_BUFFER, 0)
 		
 		if indices:
-			glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.index_buffer)
+			# the element array binding belongs to the vertex array
+			render_state.bind_vertex_array(self.vao)
 			glBufferSubData(GL_ELEMENT_ARRAY_BUFFER, 0, self.indices)
-			glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
 	
 	def draw(self):
 		glDrawElements(GL_TRIANGLES, len(self.indices), GL_UNSIGNED_INT, None)
 	
 	def __enter__(self):
-		glBindVertexArray(self.vao)
+		render_state.bind_vertex_array(self.vao)
 	
 	def __exit__(self, type, value, traceback):
-		glBindVertexArray(0)
+		pass
 
 default_vertex_shader_code = """
 #version 410
@@ -285,7 +637,7 @@ void main() {
 }
 """
 
-@cache
+@shader_factory
 def default_shader():
 	return Shader(default_vertex_shader_code, default_fragment_shader_code)
 
@@ -313,6 +665,34 @@ def rect_geometry():
 	return Geometry(positions, texcoords, indices)
 
 # based on https://www.reedbeta.com/blog/quadrilateral-interpolation-part-1/
+# returns positions and projective uvq texcoords of the 4 corners, None if the quad is degenerate
+def quad_vertices(corners, uvs):
+	corners = np.array(corners)
+	
+	center = line_intersection(corners[0], corners[2], corners[3], corners[1])
+	if center is None:
+		return None
+	
+	distances = [distance(c, center) for c in corners]
+	
+	q = [
+		(distances[0] + distances[2]) / distances[2],
+		(distances[1] + distances[3]) / distances[3],
+		(distances[2] + distances[0]) / distances[0],
+		(distances[3] + distances[1]) / distances[1],
+	]
+	
+	positions = np.array(corners, dtype=np.float32)
+	
+	texcoords = np.array([
+		uvs[0][0]*q[0], uvs[0][1]*q[0], q[0],
+		uvs[1][0]*q[1], uvs[1][1]*q[1], q[1],
+		uvs[2][0]*q[2], uvs[2][1]*q[2], q[2],
+		uvs[3][0]*q[3], uvs[3][1]*q[3], q[3],
+	], dtype=np.float32)
+	
+	return positions, texcoords
+
 class QuadGeometry(Geometry):
 	def __init__(self, corners=[[0, 0], [0, 0], [0, 0], [0, 0]], uvs=[[0, 0], [1, 0], [1, 1], [0, 1]]):
 		self.corners = corners
@@ -328,32 +708,13 @@ class QuadGeometry(Geometry):
 		super().__init__(self.positions, self.texcoords, self.indices, texcoords_size=3)
 	
 	def calculate_buffers(self):
-		corners = np.array(self.corners)
-		uvs = self.uvs
-		
-		center = line_intersection(corners[0], corners[2], corners[3], corners[1])
-		if center is None:
+		vertices = quad_vertices(self.corners, self.uvs)
+		if vertices is None:
 			self.positions = np.zeros((6, 2), dtype=np.float32)
 			self.texcoords = np.zeros((6, 3), dtype=np.float32)
 			return
 		
-		distances = [distance(c, center) for c in corners]
-		
-		q = [
-			(distances[0] + distances[2]) / distances[2],
-			(distances[1] + distances[3]) / distances[3],
-			(distances[2] + distances[0]) / distances[0],
-			(distances[3] + distances[1]) / distances[1],
-		]
-		
-		self.positions = np.array(corners, dtype=np.float32)
-		
-		self.texcoords = np.array([
-			uvs[0][0]*q[0], uvs[0][1]*q[0], q[0],
-			uvs[1][0]*q[1], uvs[1][1]*q[1], q[1],
-			uvs[2][0]*q[2], uvs[2][1]*q[2], q[2],
-			uvs[3][0]*q[3], uvs[3][1]*q[3], q[3],
-		], dtype=np.float32)
+		self.positions, self.texcoords = vertices
 	
 	def update_corners(self, corners, uvs=None):
 		self.corners = corners
@@ -389,29 +750,249 @@ void main() {
 }
 """
 
-@cache
+@shader_factory
 def quad_shader():
 	return Shader(quad_vertex_shader_code, quad_fragment_shader_code)
 
+batch_vertex_shader_code = """
+#version 410
+layout(location = 0) in vec4 position;
+layout(location = 1) in vec3 texcoord;
+layout(location = 2) in vec4 vertex_color;
+uniform mat4 matrix;
+out vec3 uvq;
+out vec4 color;
+
+void main()
+{
+	gl_Position = matrix * position;
+	uvq = texcoord;
+	color = vertex_color;
+}
+"""
+
+batch_fragment_shader_code = """
+#version 410
+in vec3 uvq;
+in vec4 color;
+uniform sampler2D main_texture;
+out vec4 fragColor;
+
+void main() {
+	fragColor = texture(main_texture, uvq.xy / uvq.z) * color;
+}
+"""
+
+@shader_factory
+def batch_shader():
+	return Shader(batch_vertex_shader_code, batch_fragment_shader_code)
+
+# collects textured and colored quads and draws them with one buffer upload. quads
+# are drawn in the order they were added without depth test, so translucent quads
+# blend like separate draws would. consecutive quads with the same texture share
+# one draw call. code that draws directly has to flush() first to stay on top.
+class QuadBatch:
+	# position xyz, texcoord uvq, color rgba
+	VERTEX_SIZE = 10
+	
+	def __init__(self, capacity=128):
+		self.capacity = 0
+		self.count = 0
+		self.textures = []
+		self.vertices = None
+		self.draw_calls = 0
+		
+		self.vao = glGenVertexArrays(1)
+		self.vertex_buffer, self.index_buffer = glGenBuffers(2)
+		
+		render_state.bind_vertex_array(self.vao)
+		glBindBuffer(GL_ARRAY_BUFFER, self.vertex_buffer)
+		
+		stride = QuadBatch.VERTEX_SIZE * 4
+		glEnableVertexAttribArray(ATTRIBUTE_LOCATION_POSITIONS)
+		glVertexAttribPointer(ATTRIBUTE_LOCATION_POSITIONS, 3, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(0))
+		glEnableVertexAttribArray(ATTRIBUTE_LOCATION_TEXTUREUV)
+		glVertexAttribPointer(ATTRIBUTE_LOCATION_TEXTUREUV, 3, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(3*4))
+		glEnableVertexAttribArray(ATTRIBUTE_LOCATION_COLOR)
+		glVertexAttribPointer(ATTRIBUTE_LOCATION_COLOR, 4, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(6*4))
+		
+		glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.index_buffer)
+		render_state.bind_vertex_array(0)
+		glBindBuffer(GL_ARRAY_BUFFER, 0)
+		glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+		
+		self.allocate(capacity)
+	
+	def allocate(self, capacity):
+		vertices = np.zeros((capacity, 4, QuadBatch.VERTEX_SIZE), dtype=np.float32)
+		if self.vertices is not None:
+			vertices[:self.count] = self.vertices[:self.count]
+		
+		self.vertices = vertices
+		self.capacity = capacity
+		
+		# top left, bottom left, top right, top right, bottom left, bottom right
+		indices = np.array([0, 3, 1, 1, 3, 2], dtype=np.uint32)
+		indices = (indices[None, :] + np.arange(capacity, dtype=np.uint32)[:, None] * 4).flatten()
+		
+		render_state.bind_vertex_array(self.vao)
+		glBindBuffer(GL_ARRAY_BUFFER, self.vertex_buffer)
+		glBufferData(GL_ARRAY_BUFFER, self.vertices.nbytes, None, GL_DYNAMIC_DRAW)
+		glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices, GL_STATIC_DRAW)
+		glBindBuffer(GL_ARRAY_BUFFER, 0)
+	
+	def add(self, corners, texture=None, uvs=[[0, 0], [1, 0], [1, 1], [0, 1]], color=(1, 1, 1, 1)):
+		vertices = quad_vertices(corners, uvs)
+		if vertices is None:
+			return
+		
+		if self.count == self.capacity:
+			self.allocate(self.capacity * 2)
+		
+		positions, texcoords = vertices
+		quad = self.vertices[self.count]
+		quad[:, 0:2] = positions
+		quad[:, 2] = 0
+		quad[:, 3:6] = texcoords.reshape(4, 3)
+		quad[:, 6:10] = convert_color(color)
+		
+		self.textures.append(texture if texture is not None else default_texture())
+		self.count += 1
+	
+	def flush(self, camera):
+		self.draw_calls = 0
+		
+		if self.count == 0:
+			return
+		
+		glBindBuffer(GL_ARRAY_BUFFER, self.vertex_buffer)
+		glBufferSubData(GL_ARRAY_BUFFER, 0, self.vertices[:self.count])
+		glBindBuffer(GL_ARRAY_BUFFER, 0)
+		
+		# all quads would be at the same depth, the submission order decides
+		depth_test = glIsEnabled(GL_DEPTH_TEST)
+		glDisable(GL_DEPTH_TEST)
+		
+		shader = batch_shader()
+		with shader:
+			render_state.uniform_matrix_4fv(shader.uniform_location("matrix"), camera.matrix)
+			render_state.uniform_1i(shader.uniform_location("main_texture"), 0)
+			render_state.active_texture(0)
+			render_state.bind_vertex_array(self.vao)
+			
+			start = 0
+			while start < self.count:
+				texture = self.textures[start]
+				end = start
+				while end < self.count and self.textures[end] is texture:
+					end += 1
+				
+				render_state.bind_texture(texture.texture)
+				glDrawElements(GL_TRIANGLES, (end - start) * 6, GL_UNSIGNED_INT, ctypes.c_void_p(start * 6 * 4))
+				self.draw_calls += 1
+				start = end
+		
+		if depth_test:
+			glEnable(GL_DEPTH_TEST)
+		
+		self.count = 0
+		self.textures = []
+
+# only uploads the parts of the canvas that changed. with track_changes="hash" the
+# canvas is split into bands of rows and only bands whose checksum changed are
+# uploaded, with "explicit" only the rects passed to mark_dirty() are uploaded and
+# with None the whole canvas is uploaded on every update().
 class CanvasTexture:
-	def __init__(self, size):
+	def __init__(self, size, track_changes="hash", band_height=16):
 		self.size = size
 		self.texture = Texture(size)
 		self.data = np.zeros(shape=size, dtype=np.uint32)
+		self.pixels = self.data.reshape(size[1], size[0]) # rows of the cairo surface
 		self.surface = cairo.ImageSurface.create_for_data(self.data, cairo.FORMAT_ARGB32, *size)
 		self.ctx = cairo.Context(self.surface)
+		self.track_changes = track_changes
+		self.band_height = band_height
+		self.band_hashes = None
+		self.dirty_rects = []
+		self.uploaded_rects = []
+	
+	def mark_dirty(self, x=0, y=0, width=None, height=None):
+		width = self.size[0] - x if width is None else width
+		height = self.size[1] - y if height is None else height
+		
+		x0, y0 = max(0, int(x)), max(0, int(y))
+		x1, y1 = min(self.size[0], int(np.ceil(x + width))), min(self.size[1], int(np.ceil(y + height)))
+		
+		if x1 > x0 and y1 > y0:
+			self.dirty_rects.append((x0, y0, x1, y1))
+	
+	def hash_bands(self):
+		return [zlib.crc32(self.pixels[y:y+self.band_height]) for y in range(0, self.size[1], self.band_height)]
+	
+	def changed_rects(self):
+		hashes = self.hash_bands()
+		rects = []
+		
+		# merge runs of consecutive changed bands into one full width rect
+		for band, (new, old) in enumerate(zip(hashes, self.band_hashes)):
+			if new == old:
+				continue
+			
+			y0 = band * self.band_height
+			y1 = min(self.size[1], y0 + self.band_height)
+			if rects and rects[-1][3] == y0:
+				rects[-1] = (0, rects[-1][1], self.size[0], y1)
+			else:
+				rects.append((0, y0, self.size[0], y1))
+		
+		self.band_hashes = hashes
+		return rects
 	
 	def update(self):
-		self.texture.update(self.data)
+		if not self.texture.size_initialized or self.track_changes is None:
+			self.texture.update(self.data)
+			self.uploaded_rects = [(0, 0, *self.size)]
+			self.dirty_rects = []
+			if self.track_changes == "hash":
+				self.band_hashes = self.hash_bands()
+			return
+		
+		rects = list(self.dirty_rects)
+		if self.track_changes == "hash":
+			rects += self.changed_rects()
+		
+		self.dirty_rects = []
+		self.uploaded_rects = merge_rects(rects)
+		
+		for x0, y0, x1, y1 in self.uploaded_rects:
+			region = self.pixels[y0:y1, x0:x1]
+			self.texture.update_region(np.ascontiguousarray(region), x0, y0, x1 - x0, y1 - y0)
 	
 	def draw(self, corners):
 		self.update()
 		self.texture.draw(corners)
 
-def load_texture(filename, format=GL_RGB, type=GL_UNSIGNED_BYTE, internal_format=GL_RGB, **kwargs):
-	image = Image.open(filename)
-	data = np.array(list(image.getdata()), dtype=np.uint8)
-	return Texture(image.size, data, format=format, type=type, internal_format=internal_format, **kwargs)
+TEXTURE_FORMATS = { 1: GL_RED, 3: GL_RGB, 4: GL_RGBA }
+FORMAT_CHANNELS = { GL_RED: 1, GL_RGB: 3, GL_RGBA: 4 }
+
+# format defaults to the channels of the image. grayscale images are uploaded as a
+# single channel and swizzled, so they sample as gray instead of red.
+def load_texture(filename, format=None, type=GL_UNSIGNED_BYTE, internal_format=None,
+	mipmaps=False, cache=True, **kwargs):
+	pixels = load_image(filename, channels=FORMAT_CHANNELS.get(format), cache=cache)
+	height, width, channels = pixels.shape
+	format = format if format is not None else TEXTURE_FORMATS[channels]
+	internal_format = internal_format if internal_format is not None else format
+	
+	texture = Texture((width, height), pixels, format=format, type=type, internal_format=internal_format, **kwargs)
+	
+	if channels == 1:
+		glTexParameteriv(GL_TEXTURE_2D, GL_TEXTURE_SWIZZLE_RGBA, [GL_RED, GL_RED, GL_RED, GL_ONE])
+	
+	if mipmaps:
+		texture.generate_mipmaps()
+	
+	return texture
 
 def corners_to_uvs(corners, size):
 	return [
@@ -0,0 +1,79 @@
+import numpy as np
+from PIL import Image
+import hashlib
+import os
+
+# decoded pixels are stored as .npy files named after the hash of the image file
+# and memory mapped on later loads, so images are decoded only once
+IMAGE_CACHE_DIR = os.environ.get("CYBERDESK_IMAGE_CACHE",
+	os.path.join(os.path.expanduser("~"), ".cache", "cyberdesk", "images"))
+
+CHANNEL_MODES = { 1: "L", 3: "RGB", 4: "RGBA" }
+
+def image_channels(image):
+	if image.mode in ("L", "RGB", "RGBA"):
+		return len(image.mode)
+	elif image.mode == "P":
+		return 4 if "transparency" in image.info else 3
+	elif image.mode in ("1", "I", "I;16", "F"):
+		return 1
+	else:
+		return 4 if "A" in image.getbands() else 3
+
+def file_hash(filename):
+	digest = hashlib.sha1()
+	with open(filename, "rb") as file:
+		for chunk in iter(lambda: file.read(1 << 20), b""):
+			digest.update(chunk)
+	
+	return digest.hexdigest()
+
+# returns a (height, width, channels) uint8 array, channels is 1, 3 or 4 and
+# defaults to what the image contains
+def decode_image(filename, channels=None):
+	with Image.open(filename) as image:
+		channels = channels if channels is not None else image_channels(image)
+		mode = CHANNEL_MODES[channels]
+		
+		if image.mode != mode:
+			image = image.convert(mode)
+		
+		# np.asarray uses the array interface of the image, no per pixel python objects
+		return np.asarray(image, dtype=np.uint8).reshape(image.size[1], image.size[0], channels)
+
+def load_image(filename, channels=None, cache=True, cache_dir=None):
+	if not cache:
+		return decode_image(filename, channels)
+	
+	cache_dir = cache_dir if cache_dir is not None else IMAGE_CACHE_DIR
+	key = file_hash(filename) + ("" if channels is None else "-" + str(channels))
+	path = os.path.join(cache_dir, key + ".npy")
+	
+	if os.path.exists(path):
+		try:
+			return np.load(path, mmap_mode="r")
+		except (ValueError, OSError):
+			pass
+	
+	pixels = decode_image(filename, channels)
+	
+	try:
+		os.makedirs(cache_dir, exist_ok=True)
+		# write to a temporary file first, other processes may read the cache at the same time
+		temp_path = "{}.{}.tmp".format(path, os.getpid())
+		with open(temp_path, "wb") as file:
+			np.save(file, pixels)
+		os.replace(temp_path, path)
+	except OSError as e:
+		print("can't write image cache:", e)
+	
+	return pixels
+
+def clear_image_cache(cache_dir=None):
+	cache_dir = cache_dir if cache_dir is not None else IMAGE_CACHE_DIR
+	if not os.path.isdir(cache_dir):
+		return
+	
+	for name in os.listdir(cache_dir):
+		if name.endswith(".npy") or name.endswith(".tmp"):
+			os.remove(os.path.join(cache_dir, name))
@@ -0,0 +1,385 @@
+import asyncio
+import collections
+import threading
+from functools import cache
+
+# the asyncio loop, connections and subscription bookkeeping of IOHub live on one
+# thread. papers subscribe from the render thread and get their messages through
+# deques, append and popleft are atomic, so neither side takes a lock.
+
+def topic_matches(pattern, topic):
+	pattern_levels = pattern.split("/")
+	topic_levels = topic.split("/")
+	
+	for index, level in enumerate(pattern_levels):
+		if level == "#":
+			return True
+		if index >= len(topic_levels):
+			return False
+		if level != "+" and level != topic_levels[index]:
+			return False
+	
+	return len(pattern_levels) == len(topic_levels)
+
+class Subscription:
+	def __init__(self, host, port, topic, max_messages=256):
+		self.host = host
+		self.port = port
+		self.topic = topic
+		self.messages = collections.deque(maxlen=max_messages)
+		self.active = True
+	
+	# returns the (topic, payload) messages received since the last call
+	def drain(self):
+		messages = []
+		while True:
+			try:
+				messages.append(self.messages.popleft())
+			except IndexError:
+				return messages
+
+# paho client driven by the asyncio loop instead of its own loop_start() thread,
+# reconnects with backoff and resubscribes its topics after every connect. messages
+# published while not connected are sent after the next connect, paho would drop
+# them when it resets its packet queue on connect.
+class MqttConnection:
+	def __init__(self, loop, host, port, on_message, min_reconnect_delay=1, max_reconnect_delay=30,
+		max_pending_publishes=256, client_factory=None):
+		if client_factory is None:
+			import paho.mqtt.client as mqtt
+			client_factory = mqtt.Client
+		
+		self.loop = loop
+		self.host = host
+		self.port = port
+		self.topics = set()
+		self.connected = False
+		self.closed = False
+		self.misc_task = None
+		self.min_reconnect_delay = min_reconnect_delay
+		self.max_reconnect_delay = max_reconnect_delay
+		self.reconnect_delay = min_reconnect_delay
+		self.connect_attempted = False
+		self.pending_publishes = collections.deque(maxlen=max_pending_publishes)
+		
+		self.client = client_factory()
+		self.client.on_connect = self.on_connect
+		self.client.on_disconnect = self.on_disconnect
+		self.client.on_message = lambda client, userdata, message: on_message(message.topic, message.payload)
+		self.client.on_socket_open = self.on_socket_open
+		self.client.on_socket_close = self.on_socket_close
+		self.client.on_socket_register_write = self.on_socket_register_write
+		self.client.on_socket_unregister_write = self.on_socket_unregister_write
+	
+	def start(self):
+		self.connect()
+	
+	# dns lookup and tcp connect block, they run on the default executor so an
+	# unreachable broker doesn't stall the connections of all other papers
+	def connect(self):
+		if self.closed:
+			return
+		
+		future = self.loop.run_in_executor(None, self.open_socket)
+		future.add_done_callback(self.on_open_socket_done)
+	
+	def open_socket(self):
+		if self.connect_attempted:
+			self.client.reconnect()
+		else:
+			self.connect_attempted = True
+			self.client.connect(self.host, self.port)
+	
+	def on_open_socket_done(self, future):
+		if future.cancelled() or future.exception() is None:
+			return
+		
+		print("can't connect to mqtt broker {}:{}: {}".format(self.host, self.port, future.exception()))
+		self.schedule_reconnect()
+	
+	# paho calls the socket callbacks on the executor thread while connecting
+	def run_on_loop(self, fn, *args):
+		try:
+			running = asyncio.get_running_loop()
+		except RuntimeError:
+			running = None
+		
+		if running is self.loop:
+			fn(*args)
+		else:
+			self.loop.call_soon_threadsafe(fn, *args)
+	
+	def schedule_reconnect(self):
+		if self.closed:
+			return
+		
+		self.loop.call_later(self.reconnect_delay, self.connect)
+		self.reconnect_delay = min(self.reconnect_delay * 2, self.max_reconnect_delay)
+	
+	def on_connect(self, client, userdata, flags, rc):
+		if rc != 0:
+			return
+		
+		self.connected = True
+		self.reconnect_delay = self.min_reconnect_delay
+		for topic in self.topics:
+			self.client.subscribe(topic)
+		
+		while self.pending_publishes:
+			self.client.publish(*self.pending_publishes.popleft())
+	
+	def on_disconnect(self, client, userdata, rc):
+		self.connected = False
+		if rc != 0:
+			self.schedule_reconnect()
+	
+	def on_socket_open(self, client, userdata, sock):
+		self.run_on_loop(self.watch_socket, sock)
+	
+	def on_socket_close(self, client, userdata, sock):
+		self.run_on_loop(self.unwatch_socket, sock)
+	
+	def on_socket_register_write(self, client, userdata, sock):
+		self.run_on_loop(self.loop.add_writer, sock, client.loop_write)
+	
+	def on_socket_unregister_write(self, client, userdata, sock):
+		self.run_on_loop(self.loop.remove_writer, sock)
+	
+	def watch_socket(self, sock):
+		self.loop.add_reader(sock, self.client.loop_read)
+		self.misc_task = self.loop.create_task(self.misc_loop())
+	
+	def unwatch_socket(self, sock):
+		self.loop.remove_reader(sock)
+		if self.misc_task is not None:
+			self.misc_task.cancel()
+			self.misc_task = None
+	
+	# keepalive pings and timeouts until loop_misc() returns an error, MQTT_ERR_SUCCESS is 0
+	async def misc_loop(self):
+		while self.client.loop_misc() == 0:
+			await asyncio.sleep(1)
+	
+	def subscribe(self, topic):
+		self.topics.add(topic)
+		if self.connected:
+			self.client.subscribe(topic)
+	
+	def unsubscribe(self, topic):
+		self.topics.discard(topic)
+		if self.connected:
+			self.client.unsubscribe(topic)
+	
+	def publish(self, topic, payload):
+		if self.connected:
+			self.client.publish(topic, payload)
+		else:
+			self.pending_publishes.append((topic, payload))
+	
+	def close(self):
+		self.closed = True
+		self.client.disconnect()
+
+# one asyncio thread for the network i/o of all papers. connections are pooled by
+# host and port, papers subscribing to the same topic share one mqtt subscription.
+# topics are unsubscribed linger seconds after their last paper left, so papers
+# whose markers flicker don't resubscribe or reconnect all the time. connections
+# without topics are closed linger seconds after their last publish.
+class IOHub:
+	def __init__(self, connection_factory=MqttConnection, linger=5):
+		self.connection_factory = connection_factory
+		self.linger = linger
+		self.loop = None
+		self.thread = None
+		self.connections = {}
+		self.subscriptions = collections.defaultdict(list)
+		self.pending_unsubscribes = {}
+		self.pending_closes = {}
+	
+	def start(self):
+		if self.thread is not None:
+			return self
+		
+		self.loop = asyncio.new_event_loop()
+		self.thread = threading.Thread(target=self.loop.run_forever, name="IOHub", daemon=True)
+		self.thread.start()
+		return self
+	
+	def stop(self):
+		if self.thread is None:
+			return
+		
+		self.loop.call_soon_threadsafe(self.close_connections)
+		self.loop.call_soon_threadsafe(self.loop.stop)
+		self.thread.join()
+		self.thread = None
+		self.loop.close()
+		self.loop = None
+	
+	def call(self, fn, *args):
+		self.start()
+		self.loop.call_soon_threadsafe(fn, *args)
+	
+	# waits until everything called before ran on the hub thread
+	def sync(self, timeout=1):
+		self.start()
+		asyncio.run_coroutine_threadsafe(asyncio.sleep(0), self.loop).result(timeout)
+	
+	def subscribe(self, host, topic, port=1883):
+		subscription = Subscription(host, port, topic)
+		self.call(self.add_subscription, subscription)
+		return subscription
+	
+	def unsubscribe(self, subscription):
+		subscription.active = False
+		self.call(self.remove_subscription, subscription)
+	
+	def publish(self, host, topic, payload, port=1883):
+		self.call(self.publish_message, (host, port), topic, payload)
+	
+	# everything below runs on the hub thread
+	
+	def connection(self, key):
+		pending = self.pending_closes.pop(key, None)
+		if pending is not None:
+			pending.cancel()
+		
+		if key not in self.connections:
+			host, port = key
+			connection = self.connection_factory(self.loop, host, port,
+				lambda topic, payload: self.dispatch(key, topic, payload))
+			self.connections[key] = connection
+			connection.start()
+		
+		return self.connections[key]
+	
+	def topic_subscribed(self, key, topic):
+		return any(subscription.topic == topic for subscription in self.subscriptions[key])
+	
+	def add_subscription(self, subscription):
+		if not subscription.active:
+			return
+		
+		key = (subscription.host, subscription.port)
+		pending = self.pending_unsubscribes.pop((key, subscription.topic), None)
+		if pending is not None:
+			pending.cancel()
+		
+		connection = self.connection(key)
+		self.subscriptions[key].append(subscription)
+		
+		if subscription.topic not in connection.topics:
+			connection.subscribe(subscription.topic)
+	
+	def remove_subscription(self, subscription):
+		key = (subscription.host, subscription.port)
+		if subscription not in self.subscriptions[key]:
+			return
+		
+		self.subscriptions[key].remove(subscription)
+		
+		if not self.topic_subscribed(key, subscription.topic):
+			pending = self.pending_unsubscribes.get((key, subscription.topic))
+			if pending is not None:
+				pending.cancel()
+			
+			handle = self.loop.call_later(self.linger, self.unsubscribe_topic, key, subscription.topic)
+			self.pending_unsubscribes[(key, subscription.topic)] = handle
+	
+	def unsubscribe_topic(self, key, topic):
+		self.pending_unsubscribes.pop((key, topic), None)
+		connection = self.connections.get(key)
+		if connection is None or self.topic_subscribed(key, topic):
+			return
+		
+		connection.unsubscribe(topic)
+		self.close_if_idle(key)
+	
+	def publish_message(self, key, topic, payload):
+		self.connection(key).publish(topic, payload)
+		
+		if not self.connections[key].topics:
+			self.pending_closes[key] = self.loop.call_later(self.linger, self.close_if_idle, key)
+	
+	def close_if_idle(self, key):
+		pending = self.pending_closes.pop(key, None)
+		if pending is not None:
+			pending.cancel()
+		
+		connection = self.connections.get(key)
+		if connection is None or connection.topics:
+			return
+		
+		# messages waiting for the connect would be lost
+		if getattr(connection, "pending_publishes", None):
+			self.pending_closes[key] = self.loop.call_later(self.linger, self.close_if_idle, key)
+			return
+		
+		connection.close()
+		del self.connections[key]
+	
+	def dispatch(self, key, topic, payload):
+		for subscription in self.subscriptions[key]:
+			if topic_matches(subscription.topic, topic):
+				subscription.messages.append((topic, payload))
+	
+	def close_connections(self):
+		for handle in [*self.pending_unsubscribes.values(), *self.pending_closes.values()]:
+			handle.cancel()
+		
+		for connection in self.connections.values():
+			connection.close()
+		
+		self.pending_unsubscribes = {}
+		self.pending_closes = {}
+		self.connections = {}
+
+# in-process stand-in for an mqtt broker, for running papers and the hub without a
+# network: hub = IOHub(connection_factory=broker.connect), then broker.publish(...)
+class LocalBroker:
+	def __init__(self):
+		self.connections = []
+		self.published = []
+	
+	def connect(self, loop, host, port, on_message):
+		return LocalConnection(self, loop, host, port, on_message)
+	
+	# can be called from any thread, messages are delivered on the hub thread
+	def publish(self, topic, payload, host=None, port=None):
+		self.published.append((host, port, topic, payload))
+		
+		for connection in list(self.connections):
+			if host is not None and (connection.host, connection.port) != (host, port if port is not None else connection.port):
+				continue
+			
+			if any(topic_matches(pattern, topic) for pattern in list(connection.topics)):
+				connection.loop.call_soon_threadsafe(connection.on_message, topic, payload)
+
+class LocalConnection:
+	def __init__(self, broker, loop, host, port, on_message):
+		self.broker = broker
+		self.loop = loop
+		self.host = host
+		self.port = port
+		self.on_message = on_message
+		self.topics = set()
+	
+	def start(self):
+		self.broker.connections.append(self)
+	
+	def subscribe(self, topic):
+		self.topics.add(topic)
+	
+	def unsubscribe(self, topic):
+		self.topics.discard(topic)
+	
+	def publish(self, topic, payload):
+		self.broker.publish(topic, payload, self.host, self.port)
+	
+	def close(self):
+		if self in self.broker.connections:
+			self.broker.connections.remove(self)
+
+@cache
+def io_hub():
+	return IOHub()
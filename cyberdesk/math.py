@@ -90,3 +90,25 @@ def rotation_from_corners(corners):
 		angle += 360
 	
 	return (180 - angle) % 360 # turn upside down
+
+# rects are (x0, y0, x1, y1)
+def rects_overlap(a, b):
+	return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+def merge_rects(rects):
+	rects = list(rects)
+	merged = True
+	
+	while merged:
+		merged = False
+		for i in range(len(rects)):
+			for j in range(i+1, len(rects)):
+				if rects_overlap(rects[i], rects[j]):
+					a, b = rects[i], rects.pop(j)
+					rects[i] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+					merged = True
+					break
+			if merged:
+				break
+	
+	return rects
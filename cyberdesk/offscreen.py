@@ -0,0 +1,118 @@
+import ctypes
+import sys
+import os
+from functools import cache
+
+# pyopengl picks the platform when OpenGL is imported for the first time, so headless
+# scripts have to call use_offscreen_platform() before importing anything from cyberdesk
+OFFSCREEN_PLATFORMS = ("egl", "osmesa")
+
+def use_offscreen_platform(platform="egl"):
+	if platform not in OFFSCREEN_PLATFORMS:
+		raise Exception("unknown offscreen platform: " + platform)
+	
+	if "OpenGL" in sys.modules and os.environ.get("PYOPENGL_PLATFORM") != platform:
+		raise Exception("use_offscreen_platform() has to be called before OpenGL is imported")
+	
+	os.environ["PYOPENGL_PLATFORM"] = platform
+
+def offscreen_platform():
+	platform = os.environ.get("PYOPENGL_PLATFORM")
+	if platform not in OFFSCREEN_PLATFORMS:
+		raise Exception("offscreen rendering needs PYOPENGL_PLATFORM=egl or osmesa, see use_offscreen_platform()")
+	
+	return platform
+
+class EGLContext:
+	def __init__(self, major=3, minor=2):
+		from OpenGL import EGL
+		
+		self.egl = EGL
+		self.display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+		if not self.display:
+			raise Exception("can't get egl display")
+		
+		version_major, version_minor = EGL.EGLint(), EGL.EGLint()
+		if not EGL.eglInitialize(self.display, ctypes.pointer(version_major), ctypes.pointer(version_minor)):
+			raise Exception("can't initialize egl")
+		
+		config_attributes = [
+			EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+			EGL.EGL_RED_SIZE, 8,
+			EGL.EGL_GREEN_SIZE, 8,
+			EGL.EGL_BLUE_SIZE, 8,
+			EGL.EGL_ALPHA_SIZE, 8,
+			EGL.EGL_DEPTH_SIZE, 24,
+			EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+			EGL.EGL_NONE,
+		]
+		config_attributes = (EGL.EGLint * len(config_attributes))(*config_attributes)
+		config = EGL.EGLConfig()
+		config_count = EGL.EGLint()
+		EGL.eglChooseConfig(self.display, config_attributes, ctypes.pointer(config), 1, ctypes.pointer(config_count))
+		if config_count.value < 1:
+			raise Exception("no egl config for offscreen rendering")
+		
+		EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+		
+		context_attributes = [
+			EGL.EGL_CONTEXT_MAJOR_VERSION, major,
+			EGL.EGL_CONTEXT_MINOR_VERSION, minor,
+			EGL.EGL_CONTEXT_OPENGL_PROFILE_MASK, EGL.EGL_CONTEXT_OPENGL_CORE_PROFILE_BIT,
+			EGL.EGL_NONE,
+		]
+		context_attributes = (EGL.EGLint * len(context_attributes))(*context_attributes)
+		self.context = EGL.eglCreateContext(self.display, config, EGL.EGL_NO_CONTEXT, context_attributes)
+		if not self.context:
+			raise Exception("can't create egl context")
+		
+		# everything is rendered into framebuffer objects, the surface is never drawn to
+		surface_attributes = [EGL.EGL_WIDTH, 1, EGL.EGL_HEIGHT, 1, EGL.EGL_NONE]
+		surface_attributes = (EGL.EGLint * len(surface_attributes))(*surface_attributes)
+		self.surface = EGL.eglCreatePbufferSurface(self.display, config, surface_attributes)
+	
+	def make_current(self):
+		if not self.egl.eglMakeCurrent(self.display, self.surface, self.surface, self.context):
+			raise Exception("can't make egl context current")
+	
+	def destroy(self):
+		self.egl.eglMakeCurrent(self.display, self.egl.EGL_NO_SURFACE, self.egl.EGL_NO_SURFACE, self.egl.EGL_NO_CONTEXT)
+		self.egl.eglDestroySurface(self.display, self.surface)
+		self.egl.eglDestroyContext(self.display, self.context)
+		self.egl.eglTerminate(self.display)
+
+# software rendering, llvmpipe when mesa is built with it
+class OSMesaContext:
+	def __init__(self, major=3, minor=2):
+		from OpenGL import osmesa, arrays
+		from OpenGL.GL import GL_UNSIGNED_BYTE
+		
+		self.osmesa = osmesa
+		self.type = GL_UNSIGNED_BYTE
+		self.context = osmesa.OSMesaCreateContextAttribs([
+			osmesa.OSMESA_FORMAT, osmesa.OSMESA_RGBA,
+			osmesa.OSMESA_DEPTH_BITS, 24,
+			osmesa.OSMESA_PROFILE, osmesa.OSMESA_CORE_PROFILE,
+			osmesa.OSMESA_CONTEXT_MAJOR_VERSION, major,
+			osmesa.OSMESA_CONTEXT_MINOR_VERSION, minor,
+			0,
+		], None)
+		if not self.context:
+			raise Exception("can't create osmesa context")
+		
+		self.buffer = arrays.GLubyteArray.zeros((1, 1, 4))
+	
+	def make_current(self):
+		if not self.osmesa.OSMesaMakeCurrent(self.context, self.buffer, self.type, 1, 1):
+			raise Exception("can't make osmesa context current")
+	
+	def destroy(self):
+		self.osmesa.OSMesaDestroyContext(self.context)
+
+# one context per process, offscreen windows share it like glfw windows share theirs
+@cache
+def offscreen_context():
+	if offscreen_platform() == "egl":
+		return EGLContext()
+	else:
+		return OSMesaContext()
@@ -1,17 +1,52 @@
 import numpy as np
 import cv2 as cv
+from cyberdesk.timing import FrameTimer
+from cyberdesk.graphics3d import QuadBatch
+from cyberdesk.math import scale_polygon
+from cyberdesk.scheduler import PRIORITY_NORMAL
+from cyberdesk.paperspace.shapes import RectShape
+from cyberdesk import clock
 
 class Space:
-	def __init__(self, camera_size, perspective_transform):
+	def __init__(self, camera_size, perspective_transform, timer=None, scheduler=None):
 		self.papers = {}
+		self.stage_names = {}
 		self.camera_size = camera_size
 		self.perspective_transform = perspective_transform
 		self.current_camera_frame = None
+		self.current_camera_frame_sequence = None
 		self.camera = None
+		self.batch = None
+		self.timer = timer if timer is not None else FrameTimer()
+		self.scheduler = scheduler
+		self.skipped_updates = 0
 	
 	def add_paper(self, paper_id, paper):
 		paper.space = self
 		self.papers[paper_id] = paper
+		self.stage_names[paper_id] = "{}#{}".format(type(paper).__name__, paper_id)
+	
+	def remove_paper(self, paper_id):
+		paper = self.papers.pop(paper_id, None)
+		self.stage_names.pop(paper_id, None)
+		
+		if paper is not None and paper.visible:
+			paper.hide()
+			paper.visible = False
+		
+		return paper
+	
+	# keeps the position of the paper, which decides the render order
+	def replace_paper(self, paper_id, paper):
+		old = self.papers.get(paper_id)
+		if old is not None and old.visible:
+			old.hide()
+			old.visible = False
+		
+		paper.space = self
+		self.papers[paper_id] = paper
+		self.stage_names[paper_id] = "{}#{}".format(type(paper).__name__, paper_id)
+		return old
 	
 	def get_paper(self, paper_id):
 		return self.papers.get(paper_id)
@@ -20,34 +55,117 @@ class Space:
 		return [paper for paper in self.papers.values() if isinstance(paper, paper_type)]
 	
 	def update(self):
-		for paper in self.papers.values():
-			paper.shape.update()
+		with self.timer.stage("shapes"):
+			for paper in self.papers.values():
+				paper.shape.update()
+		
+		with self.timer.stage("projection"):
+			self.project_shapes([paper.shape for paper in self.papers.values()])
+		
+		for paper_id, paper in self.papers.items():
 			if not paper.visible and paper.shape.present:
 				print("show paper", paper)
-				paper.show()
+				with self.timer.stage(self.stage_names[paper_id] + ".show"):
+					paper.show()
 				paper.visible = True
+				paper.last_update = None
+				paper.last_canvas_update = None
 			if paper.visible and not paper.shape.present:
 				print("hide paper", paper)
-				paper.hide()
+				with self.timer.stage(self.stage_names[paper_id] + ".hide"):
+					paper.hide()
 				paper.visible = False
 		
-		for paper in self.papers.values():
+		# under load the scheduler lets papers with low priority skip updates, they
+		# still render every frame with their last state
+		now = clock.now()
+		for offset, (paper_id, paper) in enumerate(self.papers.items()):
 			if paper.visible:
-				paper.update()
+				if self.scheduler is not None and not self.scheduler.should_update(paper, now, offset):
+					self.skipped_updates += 1
+					continue
+				
+				with self.timer.stage(self.stage_names[paper_id] + ".update"):
+					paper.update()
+				paper.last_update = now
 	
 	def render(self):
-		for paper in self.papers.values():
+		# papers add their quads to the batch, they are drawn together at the end
+		if self.batch is None:
+			self.batch = QuadBatch()
+		
+		for paper_id, paper in self.papers.items():
 			if paper.visible:
-				paper.render()
+				with self.timer.stage(self.stage_names[paper_id] + ".render"):
+					paper.render()
+		
+		with self.timer.stage("batch"):
+			self.batch.flush(self.camera)
+	
+	# under load content canvases are redrawn and uploaded at a lower rate
+	def should_update_canvas(self, paper):
+		return self.scheduler is None or self.scheduler.should_update_canvas(paper)
 	
 	def project_corners(self, corners):
 		return cv.perspectiveTransform(np.array([corners], dtype="float32"), self.perspective_transform)[0]
+	
+	# projects the corners of all shapes whose corners changed since the last call with
+	# one perspectiveTransform. shapes keep their projections until their corners change.
+	def project_shapes(self, shapes):
+		stale = [shape for shape in shapes if shape.corners is not None and shape.projected_for is not shape.corners]
+		if not stale:
+			return
+		
+		corners = np.array([shape.corners for shape in stale], dtype=np.float32).reshape(1, -1, 2)
+		projected = cv.perspectiveTransform(corners, self.perspective_transform).reshape(len(stale), 4, 2)
+		
+		for shape, shape_projected in zip(stale, projected):
+			shape.projections = { 1: shape_projected }
+			shape.projected_for = shape.corners
+	
+	# projected corners of a shape, optionally scaled around its center in camera space
+	def projected_corners(self, shape, scale=1):
+		if shape.projected_for is not shape.corners:
+			self.project_shapes([shape])
+		
+		if scale not in shape.projections:
+			shape.projections[scale] = self.project_corners(scale_polygon(shape.corners, scale))
+		
+		return shape.projections[scale]
+	
+	# projected polygons derived from the corners of a shape by polygons(corners),
+	# cached under key until the corners change
+	def projected_polygons(self, shape, key, polygons):
+		self.projected_corners(shape)
+		
+		if key not in shape.projections:
+			points = np.array(polygons(shape.corners), dtype=np.float32)
+			projected = cv.perspectiveTransform(points.reshape(1, -1, 2), self.perspective_transform)
+			shape.projections[key] = projected.reshape(points.shape)
+		
+		return shape.projections[key]
 
 class Paper:
+	# see cyberdesk.scheduler, min_update_rate is in updates per second
+	priority = PRIORITY_NORMAL
+	min_update_rate = None
+	
 	def __init__(self, shape):
 		self.shape = shape
 		self.space = None
 		self.visible = False
+		self.last_update = None
+		self.last_canvas_update = None
+	
+	# markers are the marker views of the "markers" entry in papers.json
+	@classmethod
+	def create_shape(cls, markers, prediction=None):
+		return RectShape(markers, prediction=prediction)
+	
+	# creates the paper from its entry in papers.json
+	@classmethod
+	def from_json(cls, shape, data):
+		return cls(shape)
 	
 	def show(self):
 		pass
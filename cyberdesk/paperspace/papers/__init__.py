@@ -1,31 +1,76 @@
-from cyberdesk.paperspace.shapes import RectShape, SingleShape
+import importlib
+from importlib.metadata import entry_points
+from cyberdesk.paperspace.shapes import CornerPrediction
+from cyberdesk.scheduler import PRIORITY_LOW, PRIORITY_NORMAL, PRIORITY_HIGH
 
-from .video import VideoPaper
-from .portals import PortalIn, PortalOut
-from .gamepad import GamepadPaper
-from .python import PythonPaper
-from .zigbee import ShortcutButton
+PRIORITIES = { "low": PRIORITY_LOW, "normal": PRIORITY_NORMAL, "high": PRIORITY_HIGH }
+
+# other packages can add paper types with an entry point in this group, e.g.
+# [project.entry-points."cyberdesk.papers"] clock = "mypackage.clock:ClockPaper"
+ENTRY_POINT_GROUP = "cyberdesk.papers"
+
+# type name -> Paper subclass or "module:ClassName", modules are imported the first
+# time papers.json uses one of their types
+paper_types = {}
+entry_points_loaded = False
+
+def register_paper_type(name, paper_class):
+	paper_types[name] = paper_class
+
+register_paper_type("video", "cyberdesk.paperspace.papers.video:VideoPaper")
+register_paper_type("portal-in", "cyberdesk.paperspace.papers.portals:PortalIn")
+register_paper_type("portal-out", "cyberdesk.paperspace.papers.portals:PortalOut")
+register_paper_type("gamepad", "cyberdesk.paperspace.papers.gamepad:GamepadPaper")
+register_paper_type("python", "cyberdesk.paperspace.papers.python:PythonPaper")
+register_paper_type("shortcut-button", "cyberdesk.paperspace.papers.zigbee:ShortcutButton")
+
+def load_entry_points():
+	global entry_points_loaded
+	if entry_points_loaded:
+		return
+	
+	entry_points_loaded = True
+	
+	points = entry_points()
+	points = points.select(group=ENTRY_POINT_GROUP) if hasattr(points, "select") else points.get(ENTRY_POINT_GROUP, [])
+	
+	# built-in types win, entry points are loaded only when their type is used
+	for point in points:
+		if point.name not in paper_types:
+			paper_types[point.name] = point
+
+def get_paper_type(name):
+	if name not in paper_types:
+		load_entry_points()
+	
+	if name not in paper_types:
+		raise Exception("unknown paper type: " + str(name))
+	
+	paper_class = paper_types[name]
+	
+	if isinstance(paper_class, str):
+		module_name, class_name = paper_class.split(":")
+		paper_class = getattr(importlib.import_module(module_name), class_name)
+		paper_types[name] = paper_class
+	elif not isinstance(paper_class, type):
+		paper_class = paper_class.load()
+		paper_types[name] = paper_class
+	
+	return paper_class
 
 def parse_paper_json(data, markers):
-	paper = None
-	
-	if data["type"] == "video":
-		shape = RectShape(markers.get_all(*data["markers"]))
-		paper = VideoPaper(shape, tuple(data["video_size"]), data["video_file"])
-	elif data["type"] == "portal-in":
-		shape = RectShape(markers.get_all(*data["markers"]))
-		paper = PortalIn(shape)
-	elif data["type"] == "portal-out":
-		shape = RectShape(markers.get_all(*data["markers"]))
-		paper = PortalOut(shape)
-	elif data["type"] == "gamepad":
-		shape = RectShape(markers.get_all(*data["markers"]))
-		paper = GamepadPaper(shape, data["gamepad_id"])
-	elif data["type"] == "python":
-		shape = RectShape(markers.get_all(*data["markers"]))
-		paper = PythonPaper(shape, data["filename"])
-	elif data["type"] == "shortcut-button":
-		shape = SingleShape(markers.get_all(*data["markers"])[0], absent_after=1)
-		paper = ShortcutButton(shape, data["mqtt_topic"], data["mqtt_host"])
+	paper_class = get_paper_type(data["type"])
+	
+	# optional per paper corner prediction, e.g. "prediction": {"latency": 0.05}
+	prediction = CornerPrediction(**data["prediction"]) if "prediction" in data else None
+	
+	shape = paper_class.create_shape(markers.get_all(*data["markers"]), prediction=prediction)
+	paper = paper_class.from_json(shape, data)
+	
+	# optional scheduling hints, e.g. "priority": "low", "min_update_rate": 5
+	if "priority" in data:
+		paper.priority = PRIORITIES[data["priority"]]
+	if "min_update_rate" in data:
+		paper.min_update_rate = data["min_update_rate"]
 	
 	return paper
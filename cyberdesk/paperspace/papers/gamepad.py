@@ -3,8 +3,9 @@ import glfw
 import math
 from enum import IntEnum
 from cyberdesk.paperspace import Paper
+from cyberdesk.scheduler import PRIORITY_HIGH
 from cyberdesk.graphics2d import draw_text_centered
-from cyberdesk.graphics3d import CanvasTexture, Material, quad_shader, QuadGeometry
+from cyberdesk.graphics3d import CanvasTexture
 from cyberdesk.input import Gamepad, GamepadButton, GamepadAxis
 from cyberdesk import Color
 
@@ -101,25 +102,44 @@ def draw_gamepad_image(ctx, gamepad, offset=np.array((0, 0)), scale=20,
 			ctx.fill()
 
 class GamepadPaper(Paper):
+	# input feedback should not lag
+	priority = PRIORITY_HIGH
+	
 	def __init__(self, shape, gamepad_id):
 		super().__init__(shape)
 		self.gamepad_id = gamepad_id
 		self.gamepad = None
 		self.canvas = None
-		self.material = None
-		self.geometry = None
+		self.drawn_state = None
+	
+	@classmethod
+	def from_json(cls, shape, data):
+		return cls(shape, data["gamepad_id"])
 	
 	def show(self):
 		self.gamepad = Gamepad(self.gamepad_id-1)
 		#self.canvas = CanvasTexture((400, 565))
 		self.canvas = CanvasTexture((400, 280))
-		self.material = Material(shader=quad_shader(), texture=self.canvas.texture)
-		self.geometry = QuadGeometry()
 	
 	def update(self):
 		self.gamepad.update()
 	
+	def state_key(self):
+		if not self.gamepad.present or self.gamepad.state is None:
+			return self.gamepad.present
+		
+		return tuple(self.gamepad.state.buttons), tuple(self.gamepad.state.axes)
+	
 	def render(self):
+		# only redraw and upload the canvas when a button or axis changed
+		state = self.state_key()
+		if state != self.drawn_state and self.space.should_update_canvas(self):
+			self.draw()
+			self.drawn_state = state
+		
+		self.space.batch.add(self.space.projected_corners(self.shape), texture=self.canvas.texture)
+	
+	def draw(self):
 		ctx = self.canvas.ctx
 		
 		ctx.set_source_rgb(*Color.BLACK)
@@ -138,11 +158,8 @@ class GamepadPaper(Paper):
 			draw_text_centered(ctx, text, (0, 0), self.canvas.size, font_size=25)
 		
 		self.canvas.update()
-		self.geometry.update_corners(self.space.project_corners(self.shape.corners))
-		self.space.camera.render(self.geometry, self.material)
 	
 	def hide(self):
 		self.gamepad = None
 		self.canvas = None
-		self.material = None
-		self.geometry = None
+		self.drawn_state = None
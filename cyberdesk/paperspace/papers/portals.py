@@ -1,6 +1,6 @@
 import numpy as np
 from OpenGL.GL import GL_BGR, GL_UNSIGNED_BYTE
-from cyberdesk.graphics3d import Texture, corners_to_uvs, QuadGeometry, quad_shader, Texture, Material, color_quad_material
+from cyberdesk.graphics3d import StreamingTexture, corners_to_uvs
 from cyberdesk.paperspace import Paper
 from cyberdesk.math import scale_polygon
 
@@ -8,39 +8,20 @@ PORTAL_IN_COLOR = (0, 137/256, 236/256, 1)
 PORTAL_OUT_COLOR = (247/256, 127/256, 80/256, 1)
 
 class PortalIn(Paper):
-	def __init__(self, shape):
-		super().__init__(shape)
-		self.outer_geometry = None
-		self.inner_geometry = None
-	
-	def show(self):
-		self.outer_geometry = QuadGeometry()
-		self.inner_geometry = QuadGeometry()
-	
 	def render(self):
-		self.outer_geometry.update_corners(self.space.project_corners(self.shape.corners))
-		self.inner_geometry.update_corners(self.space.project_corners(scale_polygon(self.shape.corners, 0.9)))
-		self.space.camera.render(self.outer_geometry, color_quad_material(PORTAL_IN_COLOR))
-		self.space.camera.render(self.inner_geometry, color_quad_material((0, 0, 0, 1)))
-	
-	def hide(self):
-		self.outer_geometry = None
-		self.inner_geometry = None
+		self.space.batch.add(self.space.projected_corners(self.shape), color=PORTAL_IN_COLOR)
+		self.space.batch.add(self.space.projected_corners(self.shape, 0.9), color=(0, 0, 0, 1))
 
 class PortalOut(Paper):
 	def __init__(self, shape):
 		super().__init__(shape)
-		self.outer_geometry = None
-		self.inner_geometry = None
-		self.material = None
+		self.texture = None
 		self.portal_in = None
+		self.frame_sequence = None
 	
 	def show(self):
-		self.outer_geometry = QuadGeometry()
-		self.inner_geometry = QuadGeometry()
-		
-		texture = Texture(self.space.camera_size, format=GL_BGR, type=GL_UNSIGNED_BYTE)
-		self.material = Material(shader=quad_shader(), texture=texture)
+		self.texture = StreamingTexture(self.space.camera_size, format=GL_BGR, type=GL_UNSIGNED_BYTE)
+		self.frame_sequence = None
 	
 	def update(self):
 		portal_ins = self.space.get_papers_of_type(PortalIn)
@@ -49,21 +30,20 @@ class PortalOut(Paper):
 		else:
 			self.portal_in = None
 		
-		self.material.texture.update(self.space.current_camera_frame)
+		# the display refreshes faster than the camera, upload each camera frame once
+		sequence = self.space.current_camera_frame_sequence
+		if sequence is None or sequence != self.frame_sequence:
+			self.texture.update(self.space.current_camera_frame)
+			self.frame_sequence = sequence
 	
 	def render(self):
-		self.outer_geometry.update_corners(self.space.project_corners(self.shape.corners))
-		self.space.camera.render(self.outer_geometry, color_quad_material(PORTAL_OUT_COLOR))
+		self.space.batch.add(self.space.projected_corners(self.shape), color=PORTAL_OUT_COLOR)
 		
 		if self.portal_in != None:
-			inner_rect = scale_polygon(self.shape.corners, 0.9)
 			portal_in_inner_rect = scale_polygon(self.portal_in.shape.corners, 0.9)
-			uvs = corners_to_uvs(portal_in_inner_rect, self.material.texture.size)
-			self.inner_geometry.update_corners(self.space.project_corners(inner_rect), uvs)
-			self.space.camera.render(self.inner_geometry, self.material)
+			uvs = corners_to_uvs(portal_in_inner_rect, self.texture.size)
+			self.space.batch.add(self.space.projected_corners(self.shape, 0.9), texture=self.texture, uvs=uvs)
 	
 	def hide(self):
-		self.outer_geometry = None
-		self.inner_geometry = None
-		self.material = None
+		self.texture = None
 		self.portal_in = None
@@ -2,7 +2,7 @@ import numpy as np
 import OpenGL.GL as GL
 from cyberdesk.paperspace import Paper
 from cyberdesk.graphics2d import draw_text_centered, draw_text_multiline
-from cyberdesk.graphics3d import CanvasTexture, Material, QuadGeometry, quad_shader
+from cyberdesk.graphics3d import CanvasTexture, render_state
 import cyberdesk.graphics2d
 import cyberdesk.graphics3d
 import cyberdesk.math
@@ -45,10 +45,12 @@ class PythonPaper(Paper):
 		self.scope = None
 		self.exception = None
 		self.exception_canvas = CanvasTexture((400, 280))
-		self.exception_material = Material(shader=quad_shader(), texture=self.exception_canvas.texture)
-		self.exception_geometry = QuadGeometry()
 		self.initialized = False
 	
+	@classmethod
+	def from_json(cls, shape, data):
+		return cls(shape, data["filename"])
+	
 	def show(self):
 		with open(self.filename, "r") as file:
 			source = file.read()
@@ -65,6 +67,9 @@ class PythonPaper(Paper):
 			self.initialized = True
 		except Exception as e:
 			self.exception = e
+		
+		# scripts may call gl directly
+		render_state.invalidate(uniforms=True)
 	
 	def update(self):
 		if self.initialized:
@@ -75,21 +80,29 @@ class PythonPaper(Paper):
 					self.scope["update"]()
 				except Exception as e:
 					self.exception = e
+				
+				render_state.invalidate(uniforms=True)
 	
 	def render(self):
 		if self.initialized:
 			if self.exception is None:
 				if "render" in self.scope:
+					# quads of the papers before this one have to be below its direct draws
+					self.space.batch.flush(self.space.camera)
+					
 					try:
 						self.scope["render"]()
 					except Exception as e:
 						self.exception = e
+					
+					render_state.invalidate(uniforms=True)
 		
 		if self.exception is not None:
-			draw_exception(self.exception_canvas, self.exception)
-			self.exception_canvas.update()
-			self.exception_geometry.update_corners(self.space.project_corners(self.shape.corners))
-			self.space.camera.render(self.exception_geometry, self.exception_material)
+			if self.space.should_update_canvas(self):
+				draw_exception(self.exception_canvas, self.exception)
+				self.exception_canvas.update()
+			
+			self.space.batch.add(self.space.projected_corners(self.shape), texture=self.exception_canvas.texture)
 	
 	def hide(self):
 		if self.initialized:
@@ -1,45 +1,45 @@
-import cv2 as cv
 from OpenGL.GL import GL_BGR, GL_UNSIGNED_BYTE
-from cyberdesk.graphics3d import Texture, QuadGeometry, quad_shader, Material
+from cyberdesk.graphics3d import StreamingTexture
+from cyberdesk.video import acquire_decoder, release_decoder
 from cyberdesk.paperspace import Paper
 
 class VideoPaper(Paper):
+	# frames are due by their timestamps, late updates show as stutter
+	min_update_rate = 30
+	
 	def __init__(self, shape, video_size, video_file):
 		super().__init__(shape)
 		self.video_size = video_size
 		self.video_file = video_file
-		self.capture = None
+		self.decoder = None
 		self.texture = None
-		self.material = None
-		self.geometry = None
+		self.frame_timestamp = None
+	
+	@classmethod
+	def from_json(cls, shape, data):
+		return cls(shape, tuple(data["video_size"]), data["video_file"])
 	
 	def show(self):
-		self.capture = cv.VideoCapture(self.video_file)
-		
-		self.texture = Texture(self.video_size, format=GL_BGR, type=GL_UNSIGNED_BYTE)
-		self.material = Material(shader=quad_shader(), texture=self.texture)
-		self.geometry = QuadGeometry()
+		self.decoder = acquire_decoder(self.video_file, self.video_size)
+		self.texture = StreamingTexture(self.video_size, format=GL_BGR, type=GL_UNSIGNED_BYTE)
+		self.frame_timestamp = None
 	
 	def update(self):
-		ret, frame = self.capture.read()
-		if not ret:
-			self.capture.set(cv.CAP_PROP_POS_FRAMES, 0)
-			ret, frame = self.capture.read()
-			if not ret:
-				return
+		result = self.decoder.current_frame()
+		if result is None:
+			return
 		
-		frame = cv.resize(frame, self.video_size)
-		self.texture.update(frame)
+		timestamp, frame = result
+		if timestamp != self.frame_timestamp:
+			self.texture.update(frame)
+			self.frame_timestamp = timestamp
 	
 	def render(self):
-		tl, tr, br, bl = self.shape.corners
+		tl, tr, br, bl = self.space.projected_corners(self.shape)
 		corners = [bl, tl, tr, br] # landscape
-		self.geometry.update_corners(self.space.project_corners(corners))
-		self.space.camera.render(self.geometry, self.material)
+		self.space.batch.add(corners, texture=self.texture)
 	
 	def hide(self):
-		self.capture.release()
-		self.capture = None
+		release_decoder(self.decoder)
+		self.decoder = None
 		self.texture = None
-		self.material = None
-		self.geometry = None
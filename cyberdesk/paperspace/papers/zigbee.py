@@ -1,10 +1,10 @@
 import numpy as np
-import paho.mqtt.client as mqtt
 from enum import Enum
 import json
-from cyberdesk.graphics3d import QuadGeometry, color_quad_material
 from cyberdesk.paperspace import Paper
-from cyberdesk.math import centered_rect_corners, get_center, distance, line_center, rotation_from_corners
+from cyberdesk.paperspace.shapes import SingleShape
+from cyberdesk.iohub import io_hub
+from cyberdesk.math import centered_rect_corners, get_center, distance, rotation_from_corners
 from cyberdesk import Color
 
 class ButtonEvent(Enum):
@@ -12,40 +12,60 @@ class ButtonEvent(Enum):
 	HOLD = "brightness_move_up"
 	HOLD_UP = "brightness_stop"
 
+def button_rects(corners):
+	tl, tr, br, bl = corners
+	
+	position = get_center(corners)
+	
+	size = np.mean([
+		distance(tl, tr),
+		distance(bl, br),
+		distance(tl, bl),
+		distance(tr, br),
+	])
+	
+	rotation = rotation_from_corners(corners)
+	
+	outer_rect = centered_rect_corners(position, (size+50, size+50), rotation=rotation)
+	inner_rect = centered_rect_corners(position, (size+20, size+20), rotation=rotation)
+	
+	return outer_rect, inner_rect
+
 class ShortcutButton(Paper):
 	def __init__(self, shape, mqtt_topic, mqtt_host):
 		super().__init__(shape)
 		self.mqtt_topic = mqtt_topic
 		self.mqtt_host = mqtt_host
-		self.events = []
+		self.subscription = None
 		self.pressed = False
-		self.outer_geometry = None
-		self.inner_geometry = None
 	
-	def show(self):
-		self.outer_geometry = QuadGeometry()
-		self.inner_geometry = QuadGeometry()
-		
-		self.client = mqtt.Client()
-		self.client.on_connect = lambda client, userdata, flags, rc : self.on_connect()
-		self.client.on_message = lambda client, userdata, message : self.on_message(message)
-		self.client.connect(self.mqtt_host)
-		self.client.loop_start()
+	@classmethod
+	def create_shape(cls, markers, prediction=None):
+		return SingleShape(markers[0], absent_after=1, prediction=prediction)
 	
-	def on_connect(self):
-		self.client.subscribe(self.mqtt_topic)
+	@classmethod
+	def from_json(cls, shape, data):
+		return cls(shape, data["mqtt_topic"], data["mqtt_host"])
 	
-	def on_message(self, message):
-		data = json.loads(message.payload)
-		if "action" in data:
-			event = ButtonEvent(data["action"])
-			self.events.append(event)
+	def show(self):
+		# the connection to the broker is shared with other papers and outlives hide()
+		self.subscription = io_hub().subscribe(self.mqtt_host, self.mqtt_topic)
 	
-	def update(self):
-		events = self.events
-		self.events = []
+	def parse_events(self):
+		events = []
 		
-		for event in events:
+		for topic, payload in self.subscription.drain():
+			try:
+				data = json.loads(payload)
+				if "action" in data:
+					events.append(ButtonEvent(data["action"]))
+			except ValueError as e:
+				print("invalid button message on {}: {}".format(topic, e))
+		
+		return events
+	
+	def update(self):
+		for event in self.parse_events():
 			if event == ButtonEvent.HOLD:
 				self.pressed = True
 			elif event == ButtonEvent.HOLD_UP:
@@ -56,36 +76,12 @@ class ShortcutButton(Paper):
 			self.shape.ignore_absence(seconds=3)
 	
 	def render(self):
-		tl, tr, br, bl = self.shape.corners
-		
-		position = get_center(self.shape.corners)
-		
-		size = np.mean([
-			distance(tl, tr),
-			distance(bl, br),
-			distance(tl, bl),
-			distance(tr, br),
-		])
-		
-		top_center = line_center(tl, tr)
-		
-		rotation = rotation_from_corners(self.shape.corners)
-		
-		outer_rect = centered_rect_corners(position, (size+50, size+50), rotation=rotation)
-		inner_rect = centered_rect_corners(position, (size+20, size+20), rotation=rotation)
-		self.outer_geometry.update_corners(self.space.project_corners(outer_rect))
-		self.inner_geometry.update_corners(self.space.project_corners(inner_rect))
-		
-		if self.pressed:
-			self.space.camera.render(self.outer_geometry, color_quad_material(Color.RED))
-		else:
-			self.space.camera.render(self.outer_geometry, color_quad_material(Color.BLUE))
-		self.space.camera.render(self.inner_geometry, color_quad_material(Color.BLACK))
+		outer_rect, inner_rect = self.space.projected_polygons(self.shape, "button", button_rects)
+		outer_color = Color.RED if self.pressed else Color.BLUE
+		self.space.batch.add(outer_rect, color=outer_color)
+		self.space.batch.add(inner_rect, color=Color.BLACK)
 	
 	def hide(self):
-		self.client.disconnect()
-		self.client.loop_stop()
-		self.client = None
+		io_hub().unsubscribe(self.subscription)
+		self.subscription = None
 		self.pressed = False
-		self.outer_geometry = None
-		self.inner_geometry = None
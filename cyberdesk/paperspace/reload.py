@@ -0,0 +1,88 @@
+import os
+import json
+import time
+
+# returns (added, removed, changed) paper ids between two { id: entry } dicts
+def diff_paper_entries(old, new):
+	added = [paper_id for paper_id in new if paper_id not in old]
+	removed = [paper_id for paper_id in old if paper_id not in new]
+	changed = [paper_id for paper_id in new if paper_id in old and new[paper_id] != old[paper_id]]
+	return added, removed, changed
+
+def load_paper_entries(filename):
+	with open(filename, "r") as file:
+		return { data["id"]: data for data in json.load(file) }
+
+# polls the modification time of papers.json at most every interval seconds.
+# poll() returns the new entries after a change, or None.
+class PapersFileWatcher:
+	def __init__(self, filename, interval=1):
+		self.filename = filename
+		self.interval = interval
+		self.next_check = 0
+		self.stat = self.file_stat()
+	
+	def file_stat(self):
+		try:
+			stat = os.stat(self.filename)
+			return (stat.st_mtime_ns, stat.st_size)
+		except OSError:
+			return None
+	
+	def poll(self):
+		now = time.monotonic()
+		if now < self.next_check:
+			return None
+		
+		self.next_check = now + self.interval
+		
+		stat = self.file_stat()
+		if stat is None or stat == self.stat:
+			return None
+		
+		# the file may be half written, keep the old stat and try again next time
+		try:
+			entries = load_paper_entries(self.filename)
+		except (OSError, ValueError, KeyError, TypeError) as e:
+			print("can't reload {}: {}".format(self.filename, e))
+			return None
+		
+		self.stat = stat
+		return entries
+	
+	# makes the next check load the file again even if it didn't change
+	def retry(self):
+		self.stat = None
+
+# applies the difference between two papers.json versions to a running space.
+# unchanged papers are not touched and keep their state and textures, changed papers
+# are rebuilt in place. a changed paper that can't be created keeps running as before.
+# returns the entries of the papers now in the space, for the next diff.
+def apply_paper_entries(space, old, new, create_paper):
+	added, removed, changed = diff_paper_entries(old, new)
+	applied = dict(new)
+	
+	for paper_id in removed:
+		print("remove paper", space.get_paper(paper_id))
+		space.remove_paper(paper_id)
+	
+	for paper_id in changed + added:
+		try:
+			paper = create_paper(new[paper_id])
+		except Exception as e:
+			print("can't create paper #{}: {}".format(paper_id, e))
+			
+			if paper_id in changed:
+				applied[paper_id] = old[paper_id]
+			else:
+				del applied[paper_id]
+			continue
+		
+		if paper_id in changed:
+			print("replace paper", space.get_paper(paper_id), "with", paper)
+			space.replace_paper(paper_id, paper)
+		else:
+			print("add paper", paper)
+			space.add_paper(paper_id, paper)
+	
+	return applied
@@ -1,24 +1,60 @@
 import numpy as np
-import time
+from cyberdesk import clock
 
 TOP_LEFT = 0
 TOP_RIGHT = 1
 BOTTOM_RIGHT = 2
 BOTTOM_LEFT = 3
 
+# extrapolates marker corners to the time the frame is expected to be visible on the
+# projector. needs markers from an ArrayMarkerTracker, alpha and beta are the gains of
+# its motion filter for the markers of this shape.
+class CornerPrediction:
+	def __init__(self, latency=0.05, max_extrapolation=0.1, alpha=None, beta=None):
+		self.latency = latency
+		self.max_extrapolation = max_extrapolation
+		self.alpha = alpha
+		self.beta = beta
+	
+	def configure(self, markers):
+		for marker in markers:
+			if not hasattr(marker, "predict"):
+				raise Exception("corner prediction needs markers of an ArrayMarkerTracker, got " + type(marker).__name__)
+			
+			marker.configure_filter(alpha=self.alpha, beta=self.beta)
+	
+	def corners(self, marker):
+		if marker.corners is None:
+			return None
+		else:
+			return marker.predict(clock.now() + self.latency, self.max_extrapolation)
+
+def marker_corners(marker, prediction):
+	if prediction is None:
+		return marker.corners
+	else:
+		return prediction.corners(marker)
+
 class RectShape:
-	def __init__(self, markers, smooth=True):
+	def __init__(self, markers, smooth=True, prediction=None):
 		self.markers = markers
 		self.corners = None
 		self.present = False
 		self.smooth = smooth
+		self.prediction = prediction
+		self.projections = {}
+		self.projected_for = None
+		
+		if prediction is not None:
+			prediction.configure(markers)
 	
 	@property
 	def markers_present(self):
 		return sum(1 for marker in self.markers if marker.present)
 	
 	def update(self):
-		tl, tr, br, bl = [(m.corners[0] if m.corners is not None else None) for m in self.markers]
+		corners = [marker_corners(m, self.prediction) for m in self.markers]
+		tl, tr, br, bl = [(c[0] if c is not None else None) for c in corners]
 		
 		# if markers have not moved, keep old position
 		if self.present and self.markers_present > 0 and not corners_moved([tl, tr, br, bl], self.corners):
@@ -46,13 +82,19 @@ class RectShape:
 		return "RectShape({},{},{},{})".format(*[marker.id for marker in self.markers])
 
 class SingleShape:
-	def __init__(self, marker, absent_after=None, smooth=True):
+	def __init__(self, marker, absent_after=None, smooth=True, prediction=None):
 		self.marker = marker
 		self.absent_after = absent_after
 		self.corners = None
 		self.present = False
 		self.smooth = smooth
+		self.prediction = prediction
+		self.projections = {}
+		self.projected_for = None
 		self.ignore_absence_until = None
+		
+		if prediction is not None:
+			prediction.configure([marker])
 	
 	def update(self):
 		if self.absent_after != None and self.marker.absent_time != None:
@@ -61,19 +103,20 @@ class SingleShape:
 			self.present = self.marker.present
 		
 		if self.present:
+			corners = marker_corners(self.marker, self.prediction)
 			if self.smooth:
-				self.corners = smooth_corners(self.marker.corners, self.corners)
+				self.corners = smooth_corners(corners, self.corners)
 			else:
-				self.corners = self.marker.corners
+				self.corners = corners
 		
 		if self.ignore_absence_until != None:
-			if time.time() < self.ignore_absence_until:
+			if clock.now() < self.ignore_absence_until:
 				self.present = True
 			else:
 				self.ignore_absence_until = None
 	
 	def ignore_absence(self, seconds):
-		self.ignore_absence_until = time.time() + seconds
+		self.ignore_absence_until = clock.now() + seconds
 	
 	def __str__(self):
 		return "SingleShape({})".format(self.marker.id)
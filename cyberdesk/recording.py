@@ -0,0 +1,241 @@
+import numpy as np
+import cv2 as cv
+import struct
+import time
+import os
+import queue
+import threading
+from cyberdesk.clock import set_clock, reset_clock
+
+# file layout: 64 byte header followed by fixed size records of a float64
+# capture timestamp and the raw (unflipped) BGR camera frame
+RECORDING_MAGIC = b"CDREC001"
+RECORDING_HEADER_SIZE = 64
+
+def record_dtype(width, height, channels=3):
+	return np.dtype([
+		("timestamp", "<f8"),
+		("frame", np.uint8, (height, width, channels)),
+	])
+
+# write() copies the frame into a bounded queue and returns, a writer thread writes
+# the queued frames to disk. when the disk can't keep up frames are dropped instead
+# of stalling the capture thread, replays follow the timestamps and skip the gap.
+class SessionRecorder:
+	def __init__(self, filename, queue_size=32):
+		self.filename = filename
+		self.file = None
+		self.frame_size = None
+		self.frame_count = 0
+		self.dropped_frames = 0
+		self.queue = queue.Queue(maxsize=queue_size)
+		self.thread = None
+	
+	def write(self, frame, timestamp):
+		if self.thread is None:
+			self.thread = threading.Thread(target=self.run, name="SessionRecorder", daemon=True)
+			self.thread.start()
+		
+		# only the capture thread puts, a queue that is not full stays not full
+		if self.queue.full():
+			self.dropped_frames += 1
+			return
+		
+		self.queue.put_nowait((np.array(frame, copy=True), timestamp))
+	
+	def run(self):
+		while True:
+			item = self.queue.get()
+			if item is None:
+				break
+			
+			frame, timestamp = item
+			self.write_frame(frame, timestamp)
+	
+	def write_frame(self, frame, timestamp):
+		if self.file is None:
+			height, width, channels = frame.shape
+			self.frame_size = (width, height)
+			self.file = open(self.filename, "wb")
+			header = RECORDING_MAGIC + struct.pack("<III", width, height, channels)
+			self.file.write(header.ljust(RECORDING_HEADER_SIZE, b"\0"))
+		
+		self.file.write(struct.pack("<d", timestamp))
+		self.file.write(np.ascontiguousarray(frame).data)
+		self.frame_count += 1
+	
+	def close(self):
+		if self.thread is not None:
+			if self.thread.is_alive():
+				self.queue.put(None)
+			self.thread.join()
+			self.thread = None
+		
+		if self.dropped_frames > 0:
+			print("recorder dropped {} frames, the disk was too slow".format(self.dropped_frames))
+		
+		if self.file is not None:
+			self.file.close()
+			self.file = None
+
+class Recording:
+	def __init__(self, filename):
+		with open(filename, "rb") as file:
+			header = file.read(RECORDING_HEADER_SIZE)
+		
+		if header[:len(RECORDING_MAGIC)] != RECORDING_MAGIC:
+			raise Exception("not a cyberdesk recording: " + filename)
+		
+		width, height, channels = struct.unpack_from("<III", header, len(RECORDING_MAGIC))
+		dtype = record_dtype(width, height, channels)
+		
+		# ignore a partially written last frame
+		frame_count = (os.path.getsize(filename) - RECORDING_HEADER_SIZE) // dtype.itemsize
+		
+		self.frame_size = (width, height)
+		self.records = np.memmap(filename, dtype=dtype, mode="r",
+			offset=RECORDING_HEADER_SIZE, shape=(frame_count,))
+		self.timestamps = np.array(self.records["timestamp"])
+	
+	def __len__(self):
+		return len(self.records)
+	
+	# length of one loop including the interval after the last frame
+	@property
+	def duration(self):
+		if len(self) < 2:
+			return 0
+		
+		length = self.timestamps[-1] - self.timestamps[0]
+		return length + length / (len(self) - 1)
+	
+	# frames per second, None if the recording is too short to tell
+	@property
+	def frame_rate(self):
+		if self.duration <= 0:
+			return None
+		
+		return len(self) / self.duration
+	
+	def frame(self, index):
+		return self.records[index]["frame"]
+
+# drop-in replacement for CameraStream that plays a recording. in realtime mode the
+# recording plays at its original speed and frames are dropped when the reader is too
+# slow, otherwise every read() returns the next frame. the clock of cyberdesk.clock
+# follows the recording in both modes.
+class ReplayStream:
+	def __init__(self, filename, realtime=True, loop=False, flip=-1):
+		self.recording = Recording(filename)
+		self.realtime = realtime
+		self.loop = loop
+		self.flip = flip
+		
+		if len(self.recording) == 0:
+			raise Exception("recording is empty: " + filename)
+		
+		self.index = -1
+		self.loop_offset = 0
+		self.start_time = None
+		self.sequence = 0
+		self.dropped_frames = 0
+		self.finished = False
+		self.timestamp = self.recording.timestamps[0]
+		self.fps = self.recording.frame_rate
+		
+		width, height = self.recording.frame_size
+		self.frame = np.empty((height, width, 3), dtype=np.uint8)
+		self.gray = np.empty((height, width), dtype=np.uint8)
+	
+	def time(self):
+		if self.realtime and self.start_time is not None and not self.finished:
+			return self.recording.timestamps[0] + self.loop_offset + time.time() - self.start_time
+		else:
+			return self.timestamp
+	
+	def start(self):
+		set_clock(self.time)
+		return self
+	
+	def stop(self):
+		reset_clock()
+	
+	def next_index(self):
+		if not self.realtime:
+			return self.index + 1
+		
+		if self.start_time is None:
+			self.start_time = time.time()
+		
+		position = self.recording.timestamps[0] + time.time() - self.start_time
+		last_index = len(self.recording) - 1
+		
+		if self.index == last_index and position > self.recording.timestamps[last_index]:
+			return last_index + 1
+		
+		index = int(np.searchsorted(self.recording.timestamps, position, side="right")) - 1
+		return max(index, self.index)
+	
+	# seconds until the next frame is due in realtime mode
+	def time_until_next_frame(self):
+		if not self.realtime or self.start_time is None:
+			return 0
+		
+		timestamps = self.recording.timestamps
+		if self.index + 1 < len(timestamps):
+			next_timestamp = timestamps[self.index + 1]
+		else:
+			next_timestamp = timestamps[0] + self.recording.duration
+		
+		return max(0, next_timestamp - (timestamps[0] + time.time() - self.start_time))
+	
+	# with after_sequence it sleeps until the next frame is due, but at most timeout
+	def read(self, wait=True, timeout=None, after_sequence=None):
+		result = self.read_next()
+		if not wait or after_sequence is None:
+			return result
+		
+		deadline = time.time() + timeout if timeout is not None else None
+		
+		while result is not None and result[3] == after_sequence:
+			delay = self.time_until_next_frame()
+			if deadline is not None:
+				if time.time() >= deadline:
+					break
+				delay = min(delay, deadline - time.time())
+			
+			time.sleep(max(delay, 0.001))
+			result = self.read_next()
+		
+		return result
+	
+	def read_next(self):
+		index = self.next_index()
+		
+		if index >= len(self.recording):
+			if not self.loop:
+				self.finished = True
+				return None
+			
+			self.loop_offset += self.recording.duration
+			self.start_time = time.time()
+			self.index = -1
+			index = 0
+		
+		if index > self.index:
+			if self.index >= 0:
+				self.dropped_frames += index - self.index - 1
+			
+			self.index = index
+			self.sequence += 1
+			self.timestamp = self.recording.timestamps[index] + self.loop_offset
+			cv.flip(self.recording.frame(index), self.flip, dst=self.frame)
+			cv.cvtColor(self.frame, cv.COLOR_BGR2GRAY, dst=self.gray)
+		
+		return self.frame, self.gray, float(self.timestamp), self.sequence
+	
+	def __enter__(self):
+		return self.start()
+	
+	def __exit__(self, type, value, traceback):
+		self.stop()
@@ -0,0 +1,129 @@
+PRIORITY_LOW = 0
+PRIORITY_NORMAL = 1
+PRIORITY_HIGH = 2
+
+# (update interval of low priority papers, update interval of normal priority papers,
+# redraw interval of content canvases) per quality level, high priority papers update
+# every frame
+QUALITY_LEVELS = [
+	(1, 1, 1),
+	(2, 1, 1),
+	(2, 1, 2),
+	(4, 2, 2),
+	(4, 4, 4),
+]
+
+# marker detection runs on every n-th camera frame per detection level
+DETECT_INTERVALS = [1, 2, 3, 4]
+
+# steps through level_count levels: one level up when the smoothed frame time stays
+# above budget, one level down again when there is headroom
+class BudgetLevels:
+	def __init__(self, level_count, budget, headroom=0.75, smoothing=0.1, degrade_after=5, restore_after=60):
+		self.level_count = level_count
+		self.budget = budget
+		self.headroom = headroom
+		self.smoothing = smoothing
+		self.degrade_after = degrade_after
+		self.restore_after = restore_after
+		
+		self.level = 0
+		self.frame_time = None
+		self.frame_count = 0
+		self.over_budget = 0
+		self.under_budget = 0
+		self.level_changes = 0
+	
+	def end_frame(self, duration):
+		self.frame_count += 1
+		
+		if self.frame_time is None:
+			self.frame_time = duration
+		else:
+			self.frame_time += (duration - self.frame_time) * self.smoothing
+		
+		if self.frame_time > self.budget:
+			self.over_budget += 1
+			self.under_budget = 0
+		elif self.frame_time < self.budget * self.headroom:
+			self.under_budget += 1
+			self.over_budget = 0
+		else:
+			self.over_budget = 0
+			self.under_budget = 0
+		
+		if self.over_budget >= self.degrade_after and self.level < self.level_count - 1:
+			self.set_level(self.level + 1)
+		elif self.under_budget >= self.restore_after and self.level > 0:
+			self.set_level(self.level - 1)
+	
+	def set_level(self, level):
+		self.level = level
+		self.over_budget = 0
+		self.under_budget = 0
+		self.level_changes += 1
+
+# lowers the update rate of papers and their content canvases when the render thread
+# is over budget. frame times should not include waiting for vsync. only used on the
+# render thread.
+class FrameScheduler(BudgetLevels):
+	def __init__(self, budget=1/60, **kwargs):
+		super().__init__(len(QUALITY_LEVELS), budget, **kwargs)
+	
+	def update_interval(self, priority):
+		if priority >= PRIORITY_HIGH:
+			return 1
+		
+		return QUALITY_LEVELS[self.level][0 if priority <= PRIORITY_LOW else 1]
+	
+	@property
+	def canvas_interval(self):
+		return QUALITY_LEVELS[self.level][2]
+	
+	# papers with a lower update rate are spread over the frames by offset, papers
+	# are updated at least with their min_update_rate
+	def should_update(self, paper, now, offset=0):
+		interval = self.update_interval(paper.priority)
+		if interval == 1 or paper.last_update is None:
+			return True
+		
+		if paper.min_update_rate is not None and now - paper.last_update >= 1 / paper.min_update_rate:
+			return True
+		
+		return (self.frame_count + offset) % interval == 0
+	
+	# papers ask before they redraw and upload a canvas, a skipped canvas keeps
+	# showing its last content
+	def should_update_canvas(self, paper):
+		if paper.last_canvas_update is not None and self.frame_count - paper.last_canvas_update < self.canvas_interval:
+			return False
+		
+		paper.last_canvas_update = self.frame_count
+		return True
+	
+	def report(self):
+		low, normal, canvas = QUALITY_LEVELS[self.level]
+		return "quality level: {} (low 1/{}, normal 1/{}, canvas 1/{}), frame {:.1f}ms".format(
+			self.level, low, normal, canvas, (self.frame_time or 0) * 1000)
+
+# skips marker detection on some camera frames when processing a camera frame takes
+# longer than the time between camera frames. fed with the frame times of the thread
+# that detects markers and only used on that thread, the tracker keeps the state of
+# markers on skipped frames.
+class DetectionScheduler(BudgetLevels):
+	def __init__(self, budget=1/30, restore_after=30, **kwargs):
+		super().__init__(len(DETECT_INTERVALS), budget, restore_after=restore_after, **kwargs)
+		self.detect_count = 0
+	
+	@property
+	def detect_interval(self):
+		return DETECT_INTERVALS[self.level]
+	
+	# called once per camera frame, False if detection should be skipped
+	def should_detect(self):
+		self.detect_count += 1
+		return self.detect_count % self.detect_interval == 0
+	
+	def report(self):
+		return "detection level: {} (detect 1/{}), vision frame {:.1f}ms".format(
+			self.level, self.detect_interval, (self.frame_time or 0) * 1000)
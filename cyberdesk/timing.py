@@ -0,0 +1,107 @@
+import numpy as np
+import time
+
+class RollingHistogram:
+	def __init__(self, size=300):
+		self.samples = np.zeros(size, dtype=np.float64)
+		self.count = 0
+		self.index = 0
+	
+	def add(self, value):
+		self.samples[self.index] = value
+		self.index = (self.index + 1) % len(self.samples)
+		self.count = min(self.count + 1, len(self.samples))
+	
+	@property
+	def values(self):
+		return self.samples[:self.count]
+	
+	@property
+	def last(self):
+		return self.samples[self.index - 1] if self.count > 0 else 0
+	
+	def percentiles(self, percentiles=(50, 95, 99)):
+		if self.count == 0:
+			return [0 for _ in percentiles]
+		
+		return list(np.percentile(self.values, percentiles))
+
+# one per timed block, so stages of the same name can nest or run on several threads
+class Stage:
+	def __init__(self, timer, name):
+		self.timer = timer
+		self.name = name
+		self.start = None
+	
+	def __enter__(self):
+		self.start = time.perf_counter()
+	
+	def __exit__(self, type, value, traceback):
+		self.timer.add(self.name, time.perf_counter() - self.start)
+
+# collects the duration of named stages per frame into rolling histograms.
+# frames longer than budget are counted as overruns and the stage times of the
+# last overrun are kept to find out what ate the budget.
+class FrameTimer:
+	def __init__(self, budget=1/60, window_size=300):
+		self.budget = budget
+		self.window_size = window_size
+		self.histograms = {}
+		self.current = {}
+		self.frame_start = None
+		self.frame_count = 0
+		self.overruns = 0
+		self.last_overrun = None
+	
+	def stage(self, name):
+		return Stage(self, name)
+	
+	def add(self, name, duration):
+		if name not in self.histograms:
+			self.histograms[name] = RollingHistogram(self.window_size)
+		
+		self.histograms[name].add(duration)
+		self.current[name] = self.current.get(name, 0) + duration
+	
+	def begin_frame(self):
+		self.current = {}
+		self.frame_start = time.perf_counter()
+	
+	def end_frame(self):
+		if self.frame_start is None:
+			return None
+		
+		duration = time.perf_counter() - self.frame_start
+		self.add("frame", duration)
+		self.frame_count += 1
+		self.frame_start = None
+		
+		if self.budget is not None and duration > self.budget:
+			self.overruns += 1
+			self.last_overrun = dict(self.current)
+		
+		return duration
+	
+	def overrun_stages(self, count=3):
+		if self.last_overrun is None:
+			return []
+		
+		stages = [(name, duration) for name, duration in self.last_overrun.items() if name != "frame"]
+		return sorted(stages, key=lambda stage: stage[1], reverse=True)[:count]
+	
+	# returns { stage: (p50, p95, p99) } in seconds
+	def stats(self, percentiles=(50, 95, 99)):
+		# list() because stages can be added on another thread while reading
+		return { name: histogram.percentiles(percentiles) for name, histogram in list(self.histograms.items()) }
+	
+	def report(self):
+		lines = ["{:<28} {:>7} {:>7} {:>7}".format("stage (ms)", "p50", "p95", "p99")]
+		
+		for name, values in sorted(self.stats().items()):
+			lines.append("{:<28} {:>7.2f} {:>7.2f} {:>7.2f}".format(name[:28], *[v * 1000 for v in values]))
+		
+		if self.last_overrun is not None:
+			lines.append("overruns: {}, last: {}".format(self.overruns, ", ".join(
+				"{} {:.1f}ms".format(name, duration * 1000) for name, duration in self.overrun_stages())))
+		
+		return "\n".join(lines)
@@ -0,0 +1,123 @@
+import cv2 as cv
+import collections
+import threading
+import os
+from cyberdesk import clock
+
+# decodes a video file on a thread into a bounded queue of frames resized to size.
+# frames carry their stream timestamp, current_frame() returns the frame that is due
+# at the time since playback started. loops forever, timestamps keep increasing.
+class VideoDecoder:
+	def __init__(self, filename, size, queue_size=8):
+		self.filename = filename
+		self.size = tuple(size)
+		self.queue_size = queue_size
+		
+		self.capture = cv.VideoCapture(filename)
+		fps = self.capture.get(cv.CAP_PROP_FPS)
+		self.frame_time = 1 / fps if fps > 0 else 1 / 30
+		
+		self.frames = collections.deque()
+		self.lock = threading.Lock()
+		self.not_full = threading.Condition(self.lock)
+		self.running = False
+		self.thread = None
+		self.start_time = None
+		self.decoded_frames = 0
+		self.users = 0
+	
+	def start(self):
+		if self.running:
+			return self
+		
+		self.running = True
+		self.thread = threading.Thread(target=self.run, name="VideoDecoder", daemon=True)
+		self.thread.start()
+		return self
+	
+	def stop(self):
+		with self.lock:
+			self.running = False
+			self.not_full.notify_all()
+		
+		if self.thread is not None:
+			self.thread.join()
+			self.thread = None
+		
+		self.capture.release()
+	
+	def run(self):
+		loop_start = 0
+		loop_frames = 0
+		raw = None
+		
+		while True:
+			with self.lock:
+				while self.running and len(self.frames) >= self.queue_size:
+					self.not_full.wait()
+				
+				if not self.running:
+					break
+			
+			ret, raw = self.capture.read(raw)
+			if not ret:
+				if loop_frames == 0:
+					print("can't decode video", self.filename)
+					break
+				
+				self.capture.set(cv.CAP_PROP_POS_FRAMES, 0)
+				loop_start += loop_frames * self.frame_time
+				loop_frames = 0
+				continue
+			
+			if raw.shape[1::-1] == self.size:
+				frame = raw.copy()
+			else:
+				frame = cv.resize(raw, self.size)
+			
+			timestamp = loop_start + loop_frames * self.frame_time
+			loop_frames += 1
+			
+			with self.lock:
+				self.frames.append((timestamp, frame))
+				self.decoded_frames += 1
+	
+	# returns (timestamp, frame) of the newest frame with timestamp <= stream_time or
+	# None if no frame is due yet. the frame stays queued for other users.
+	def frame_at(self, stream_time):
+		with self.lock:
+			if not self.frames or self.frames[0][0] > stream_time:
+				return None
+			
+			while len(self.frames) > 1 and self.frames[1][0] <= stream_time:
+				self.frames.popleft()
+				self.not_full.notify()
+			
+			return self.frames[0]
+	
+	def current_frame(self):
+		now = clock.now()
+		if self.start_time is None:
+			self.start_time = now
+		
+		return self.frame_at(now - self.start_time)
+
+# papers showing the same file at the same size share one decoder
+decoders = {}
+
+def acquire_decoder(filename, size, queue_size=8):
+	key = (os.path.abspath(filename), tuple(size))
+	
+	if key not in decoders:
+		decoders[key] = VideoDecoder(filename, size, queue_size).start()
+	
+	decoder = decoders[key]
+	decoder.users += 1
+	return decoder
+
+def release_decoder(decoder):
+	decoder.users -= 1
+	
+	if decoder.users <= 0:
+		decoders.pop((os.path.abspath(decoder.filename), decoder.size), None)
+		decoder.stop()
@@ -1,6 +1,14 @@
 import cv2 as cv
 import cv2.aruco as aruco
+import numpy as np
+import threading
 import time
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+from cyberdesk import clock
+from cyberdesk.math import merge_rects
+from cyberdesk.timing import FrameTimer
 
 def get_camera_capture(width, height, camera_id=0):
 	cap = cv.VideoCapture(camera_id)
@@ -17,14 +25,445 @@ def get_camera_frame(cap, flip=-1):
 	gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
 	return frame, gray
 
+class CameraStream:
+	def __init__(self, source=0, size=None, flip=-1, buffer_size=3, loop=False, realtime=None, recorder=None):
+		if buffer_size < 3:
+			raise Exception("CameraStream needs at least 3 buffers")
+		
+		if isinstance(source, cv.VideoCapture):
+			self.capture = source
+		elif isinstance(source, int) and size is not None:
+			self.capture = get_camera_capture(*size, camera_id=source)
+		else:
+			self.capture = cv.VideoCapture(source)
+		
+		self.is_file = isinstance(source, str)
+		self.flip = flip
+		self.buffer_size = buffer_size
+		self.loop = loop
+		self.realtime = self.is_file if realtime is None else realtime
+		self.recorder = recorder
+		
+		# 0 when the backend doesn't know it
+		fps = self.capture.get(cv.CAP_PROP_FPS)
+		self.fps = fps if fps > 0 else None
+		
+		self.frames = None
+		self.grays = None
+		self.timestamps = np.zeros(buffer_size, dtype=np.float64)
+		self.sequences = np.zeros(buffer_size, dtype=np.int64)
+		
+		self.latest = None
+		self.reading = None
+		self.latest_consumed = True
+		self.sequence = 0
+		self.dropped_frames = 0
+		self.conversion_time = None
+		self.finished = False
+		self.error = None
+		
+		self.lock = threading.Lock()
+		self.frame_available = threading.Condition(self.lock)
+		self.running = False
+		self.thread = None
+	
+	def start(self):
+		if self.running:
+			return self
+		
+		self.running = True
+		self.thread = threading.Thread(target=self.run, name="CameraStream", daemon=True)
+		self.thread.start()
+		return self
+	
+	def stop(self):
+		self.running = False
+		
+		if self.thread is not None:
+			self.thread.join()
+			self.thread = None
+		
+		self.capture.release()
+		
+		if self.recorder is not None:
+			self.recorder.close()
+	
+	def allocate(self, frame):
+		self.frames = np.empty((self.buffer_size, *frame.shape), dtype=frame.dtype)
+		self.grays = np.empty((self.buffer_size, *frame.shape[:2]), dtype=np.uint8)
+	
+	def free_slot(self):
+		for index in range(self.buffer_size):
+			if index != self.latest and index != self.reading:
+				return index
+	
+	def run(self):
+		frame_time = 0
+		if self.realtime and self.fps is not None:
+			frame_time = 1 / self.fps
+		
+		next_frame = time.time()
+		raw = None
+		
+		while self.running:
+			ret, raw = self.capture.read(raw)
+			if not ret:
+				if self.is_file and self.loop:
+					self.capture.set(cv.CAP_PROP_POS_FRAMES, 0)
+					continue
+				
+				# files end, cameras fail, e.g. when they are unplugged or busy
+				if not self.is_file:
+					self.error = Exception("can't read from camera")
+				break
+			
+			now = time.time()
+			
+			if self.recorder is not None:
+				self.recorder.write(raw, now)
+			
+			if self.frames is None:
+				self.allocate(raw)
+			
+			with self.lock:
+				index = self.free_slot()
+			
+			conversion_start = time.perf_counter()
+			cv.flip(raw, self.flip, dst=self.frames[index])
+			cv.cvtColor(self.frames[index], cv.COLOR_BGR2GRAY, dst=self.grays[index])
+			self.conversion_time = time.perf_counter() - conversion_start
+			
+			with self.lock:
+				self.sequence += 1
+				self.timestamps[index] = now
+				self.sequences[index] = self.sequence
+				
+				if not self.latest_consumed:
+					self.dropped_frames += 1
+				
+				self.latest = index
+				self.latest_consumed = False
+				self.frame_available.notify_all()
+			
+			if frame_time > 0:
+				next_frame += frame_time
+				delay = next_frame - time.time()
+				if delay > 0:
+					time.sleep(delay)
+				else:
+					next_frame = time.time()
+		
+		with self.lock:
+			self.finished = True
+			self.running = False
+			self.frame_available.notify_all()
+	
+	def has_frame_after(self, sequence):
+		return self.latest is not None and (sequence is None or self.sequences[self.latest] != sequence)
+	
+	# returns (frame, gray, timestamp, sequence) of the newest frame, the arrays
+	# stay valid until the next read(). None if there is no frame (yet) or the stream
+	# finished and its last frame was read. with after_sequence it waits for a frame
+	# with another sequence, but at most timeout.
+	def read(self, wait=True, timeout=None, after_sequence=None):
+		with self.lock:
+			if wait and not self.has_frame_after(after_sequence):
+				self.frame_available.wait_for(lambda: self.has_frame_after(after_sequence) or self.finished, timeout)
+			
+			if self.latest is None or (self.finished and self.latest_consumed):
+				return None
+			
+			index = self.latest
+			self.reading = index
+			self.latest_consumed = True
+			
+			return self.frames[index], self.grays[index], float(self.timestamps[index]), int(self.sequences[index])
+	
+	def __enter__(self):
+		return self.start()
+	
+	def __exit__(self, type, value, traceback):
+		self.stop()
+
+@cache
+def get_aruco_dictionary(dictionary=aruco.DICT_4X4_250):
+	return aruco.Dictionary_get(dictionary)
+
+DETECTOR_PRESETS = {
+	# no corner refinement, two threshold windows, ignores small markers
+	"fast": dict(
+		cornerRefinementMethod=aruco.CORNER_REFINE_NONE,
+		adaptiveThreshWinSizeMin=3,
+		adaptiveThreshWinSizeMax=13,
+		adaptiveThreshWinSizeStep=10,
+		minMarkerPerimeterRate=0.05,
+	),
+	# opencv defaults plus subpixel refinement
+	"balanced": dict(
+		cornerRefinementMethod=aruco.CORNER_REFINE_SUBPIX,
+		adaptiveThreshWinSizeMin=3,
+		adaptiveThreshWinSizeMax=23,
+		adaptiveThreshWinSizeStep=10,
+		minMarkerPerimeterRate=0.03,
+	),
+	# more threshold windows and smaller markers, e.g. for high resolution cameras
+	"accurate": dict(
+		cornerRefinementMethod=aruco.CORNER_REFINE_SUBPIX,
+		adaptiveThreshWinSizeMin=3,
+		adaptiveThreshWinSizeMax=33,
+		adaptiveThreshWinSizeStep=5,
+		minMarkerPerimeterRate=0.01,
+	),
+}
+
+# duration of the last detect() and the average over all of them
+class DetectionStats:
+	def __init__(self):
+		self.detection_time = None
+		self.detection_count = 0
+		self.total_detection_time = 0
+	
+	@property
+	def average_detection_time(self):
+		if self.detection_count == 0:
+			return None
+		else:
+			return self.total_detection_time / self.detection_count
+	
+	def record_detection_time(self, start):
+		self.detection_time = time.perf_counter() - start
+		self.detection_count += 1
+		self.total_detection_time += self.detection_time
+
+class MarkerDetector(DetectionStats):
+	def __init__(self, preset="balanced", dictionary=aruco.DICT_4X4_250, **parameters):
+		super().__init__()
+		
+		if preset not in DETECTOR_PRESETS:
+			raise Exception("unknown detector preset: " + str(preset))
+		
+		self.preset = preset
+		self.dictionary = get_aruco_dictionary(dictionary)
+		self.parameter_values = { **DETECTOR_PRESETS[preset], **parameters }
+		self.parameters = self.create_parameters()
+	
+	def create_parameters(self, perimeter_scale=1):
+		parameters = aruco.DetectorParameters_create()
+		
+		for name, value in self.parameter_values.items():
+			setattr(parameters, name, value)
+		
+		parameters.minMarkerPerimeterRate *= perimeter_scale
+		parameters.maxMarkerPerimeterRate *= perimeter_scale
+		return parameters
+	
+	def detect(self, gray):
+		start = time.perf_counter()
+		corners, ids = self.find_markers(gray)
+		self.record_detection_time(start)
+		
+		return corners, ids
+	
+	# detects without recording the time, for callers that time a bigger unit of work
+	def find_markers(self, gray):
+		corners, ids, rejectedImgPoints = aruco.detectMarkers(
+			gray, self.dictionary, parameters=self.parameters)
+		
+		return corners, ids
+
+class PyramidMarkerDetector(MarkerDetector):
+	def __init__(self, levels=1, refine_window=None, preset="balanced", **parameters):
+		# corners are refined at full resolution, refining the downscaled ones is wasted work
+		parameters.setdefault("cornerRefinementMethod", aruco.CORNER_REFINE_NONE)
+		super().__init__(preset=preset, **parameters)
+		
+		self.levels = levels
+		self.scale = 2**levels
+		# the search window has to cover the rounding error of the downscaled corners
+		self.refine_window = refine_window if refine_window is not None else self.scale + 2
+		self.refine_criteria = (cv.TERM_CRITERIA_EPS + cv.TERM_CRITERIA_MAX_ITER, 30, 0.01)
+	
+	def find_markers(self, gray):
+		small = gray
+		for _ in range(self.levels):
+			small = cv.pyrDown(small)
+		
+		corners, ids, rejectedImgPoints = aruco.detectMarkers(
+			small, self.dictionary, parameters=self.parameters)
+		
+		if ids is not None:
+			points = np.concatenate(corners).reshape(-1, 1, 2)
+			points = (points + 0.5) * self.scale - 0.5
+			points = cv.cornerSubPix(gray, points.astype(np.float32),
+				(self.refine_window, self.refine_window), (-1, -1), self.refine_criteria)
+			corners = list(points.reshape(-1, 1, 4, 2))
+		
+		return corners, ids
+
+@cache
+def default_detector():
+	return MarkerDetector()
+
 def detect_markers(gray):
-	aruco_dict = aruco.Dictionary_get(aruco.DICT_4X4_250)
-	params = aruco.DetectorParameters_create()
-	params.cornerRefinementMethod = aruco.CORNER_REFINE_SUBPIX
-	corners, ids, rejectedImgPoints = aruco.detectMarkers(
-		gray, aruco_dict, parameters=params)
+	return default_detector().detect(gray)
+
+def marker_rect(corners, padding, min_padding, frame_size):
+	x0, y0 = corners.min(axis=0)
+	x1, y1 = corners.max(axis=0)
+	pad = max(min_padding, padding * max(x1 - x0, y1 - y0))
+	
+	return (
+		max(0, int(x0 - pad)),
+		max(0, int(y0 - pad)),
+		min(frame_size[0], int(np.ceil(x1 + pad))),
+		min(frame_size[1], int(np.ceil(y1 + pad))),
+	)
+
+def concat_detections(detections):
+	corners = []
+	ids = []
+	seen = set()
+	
+	for marker_corners, marker_ids in detections:
+		if marker_ids is None:
+			continue
+		
+		for i in range(len(marker_ids)):
+			marker_id = int(marker_ids[i][0])
+			if marker_id not in seen:
+				seen.add(marker_id)
+				corners.append(marker_corners[i])
+				ids.append(marker_id)
+	
+	if len(ids) == 0:
+		return [], None
+	
+	return corners, np.array(ids, dtype=np.int32).reshape(-1, 1)
+
+def tile_rects(frame_size, tiles, overlap):
+	width, height = frame_size
+	columns, rows = tiles
+	tile_width = int(np.ceil(width / columns))
+	tile_height = int(np.ceil(height / rows))
+	rects = []
+	
+	for row in range(rows):
+		for column in range(columns):
+			x0 = column * tile_width
+			y0 = row * tile_height
+			rects.append((
+				max(0, x0 - overlap),
+				max(0, y0 - overlap),
+				min(width, x0 + tile_width + overlap),
+				min(height, y0 + tile_height + overlap),
+			))
+	
+	return rects
+
+class ParallelMarkerDetector(MarkerDetector):
+	# overlap has to be larger than the biggest marker on the frame, otherwise
+	# a marker on a tile edge is cut off in every tile and not found at all
+	def __init__(self, tiles=(2, 2), overlap=96, workers=None, preset="balanced", **parameters):
+		super().__init__(preset=preset, **parameters)
+		
+		self.tiles = tiles
+		self.overlap = overlap
+		self.workers = workers if workers is not None else min(tiles[0] * tiles[1], os.cpu_count() or 1)
+		self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="MarkerDetector")
+		self.tile_parameters = {}
+	
+	# opencv takes the marker perimeter rates relative to the image it gets, scaled
+	# to the frame they accept the same marker sizes on a tile as on the whole frame
+	def parameters_for_tile(self, frame_size, tile_size):
+		key = (max(frame_size), max(tile_size))
+		if key not in self.tile_parameters:
+			self.tile_parameters[key] = self.create_parameters(perimeter_scale=key[0] / key[1])
+		
+		return self.tile_parameters[key]
+	
+	def detect_tile(self, gray, rect, parameters):
+		x0, y0, x1, y1 = rect
+		corners, ids, rejectedImgPoints = aruco.detectMarkers(
+			gray[y0:y1, x0:x1], self.dictionary, parameters=parameters)
+		offset = np.array([x0, y0], dtype=np.float32)
+		
+		return [c + offset for c in corners], ids
+	
+	def find_markers(self, gray):
+		frame_size = (gray.shape[1], gray.shape[0])
+		rects = tile_rects(frame_size, self.tiles, self.overlap)
+		
+		# tiles at the edges are smaller, parameters are looked up before the threads start
+		tiles = [(rect, self.parameters_for_tile(frame_size, (rect[2] - rect[0], rect[3] - rect[1]))) for rect in rects]
+		detections = self.executor.map(lambda tile: self.detect_tile(gray, *tile), tiles)
+		
+		return concat_detections(detections)
 	
-	return corners, ids
+	def close(self):
+		self.executor.shutdown()
+
+# the stats cover the whole detect() including all searched windows, the stats of
+# the wrapped detector are not updated
+class TrackingMarkerDetector(DetectionStats):
+	def __init__(self, tracker, detector=None, full_scan_interval=30,
+		padding=1.0, min_padding=32, max_absent_frames=5):
+		super().__init__()
+		
+		self.tracker = tracker
+		self.detector = detector if detector is not None else default_detector()
+		self.full_scan_interval = full_scan_interval
+		self.padding = padding
+		self.min_padding = min_padding
+		self.max_absent_frames = max_absent_frames
+		self.frames_since_full_scan = None
+		self.full_scan = False
+		self.rects = []
+		self.scanned_pixels = 0
+	
+	def detect_full(self, gray):
+		self.frames_since_full_scan = 0
+		self.full_scan = True
+		self.rects = [(0, 0, gray.shape[1], gray.shape[0])]
+		self.scanned_pixels = gray.shape[0] * gray.shape[1]
+		
+		return self.detector.find_markers(gray)
+	
+	def detect_rect(self, gray, rect):
+		x0, y0, x1, y1 = rect
+		corners, ids = self.detector.find_markers(gray[y0:y1, x0:x1])
+		offset = np.array([x0, y0], dtype=np.float32)
+		
+		return [c + offset for c in corners], ids
+	
+	def detect(self, gray):
+		start = time.perf_counter()
+		corners, ids = self.find_markers(gray)
+		self.record_detection_time(start)
+		
+		return corners, ids
+	
+	def find_markers(self, gray):
+		frame_size = (gray.shape[1], gray.shape[0])
+		tracked = self.tracker.recent_markers(self.max_absent_frames)
+		
+		if (not tracked or self.frames_since_full_scan is None
+			or self.frames_since_full_scan >= self.full_scan_interval):
+			return self.detect_full(gray)
+		
+		self.frames_since_full_scan += 1
+		self.full_scan = False
+		self.rects = merge_rects(marker_rect(m.corners, self.padding, self.min_padding, frame_size) for m in tracked)
+		self.scanned_pixels = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in self.rects)
+		
+		corners, ids = concat_detections(self.detect_rect(gray, rect) for rect in self.rects)
+		
+		# a marker that was visible in the last frame left its window, search everywhere
+		found = set() if ids is None else set(int(i) for i in ids.flatten())
+		for marker in tracked:
+			if marker.present and int(marker.id) not in found:
+				return self.detect_full(gray)
+		
+		return corners, ids
 
 class Marker:
 	def __init__(self, id):
@@ -42,14 +481,14 @@ class Marker:
 		if self.last_seen is None:
 			return None
 		else:
-			return time.time() - self.last_seen
+			return clock.now() - self.last_seen
 
 class MarkerTracker:
 	def __init__(self):
 		self.markers = {}
 	
-	def process_frame(self, marker_corners, marker_ids):
-		now = time.time()
+	def process_frame(self, marker_corners, marker_ids, timestamp=None):
+		now = timestamp if timestamp is not None else clock.now()
 		
 		for _, marker in self.markers.items():
 			if marker.absent_frames != None:
@@ -64,6 +503,10 @@ class MarkerTracker:
 				marker.absent_frames = 0
 				marker.last_seen = now
 	
+	def recent_markers(self, max_absent_frames):
+		return [marker for marker in self.markers.values()
+			if marker.absent_frames is not None and marker.absent_frames <= max_absent_frames]
+	
 	def get(self, marker_id):
 		marker_id = str(marker_id)
 		
@@ -75,6 +518,350 @@ class MarkerTracker:
 	def get_all(self, *marker_ids):
 		return list(map(self.get, marker_ids))
 
+class MarkerView:
+	def __init__(self, tracker, index):
+		self.tracker = tracker
+		self.index = index
+		self.id = str(index)
+	
+	@property
+	def corners(self):
+		if self.tracker.absent_frames[self.index] < 0:
+			return None
+		else:
+			return self.tracker.corners[self.index].copy()
+	
+	@property
+	def absent_frames(self):
+		absent_frames = self.tracker.absent_frames[self.index]
+		return None if absent_frames < 0 else int(absent_frames)
+	
+	@property
+	def last_seen(self):
+		last_seen = self.tracker.last_seen[self.index]
+		return None if np.isnan(last_seen) else float(last_seen)
+	
+	@property
+	def present(self):
+		return self.tracker.absent_frames[self.index] == 0
+	
+	@property
+	def absent_time(self):
+		last_seen = self.last_seen
+		if last_seen is None:
+			return None
+		else:
+			return clock.now() - last_seen
+	
+	def configure_filter(self, alpha=None, beta=None):
+		self.tracker.filter.configure([self.index], alpha=alpha, beta=beta)
+	
+	def predict(self, timestamp, max_extrapolation=0.1):
+		if self.tracker.absent_frames[self.index] < 0:
+			return None
+		else:
+			return self.tracker.filter.predict([self.index], timestamp, max_extrapolation)[0]
+
+# constant velocity alpha-beta filter (the steady state of a kalman filter) over the
+# corners of all markers at once. state is reset for markers that were absent longer
+# than reset_after seconds, so papers that reappear don't fly in from their old position.
+class MotionFilter:
+	def __init__(self, size=250, alpha=0.6, beta=0.2, reset_after=0.25):
+		self.positions = np.zeros((size, 4, 2), dtype=np.float32)
+		self.velocities = np.zeros((size, 4, 2), dtype=np.float32)
+		self.timestamps = np.full(size, np.nan, dtype=np.float64)
+		self.alpha = np.full(size, alpha, dtype=np.float32)
+		self.beta = np.full(size, beta, dtype=np.float32)
+		self.reset_after = reset_after
+	
+	def configure(self, ids, alpha=None, beta=None):
+		if alpha is not None:
+			self.alpha[ids] = alpha
+		if beta is not None:
+			self.beta[ids] = beta
+	
+	def update(self, ids, corners, timestamp):
+		dt = timestamp - self.timestamps[ids]
+		
+		# the same frame fed again leaves the filter alone, streams return their
+		# latest frame until there is a new one
+		fresh = dt != 0
+		ids, corners, dt = ids[fresh], corners[fresh], dt[fresh]
+		reset = np.isnan(dt) | (dt < 0) | (dt > self.reset_after)
+		
+		dt = np.where(reset, 1, dt).astype(np.float32)[:, None, None]
+		alpha = self.alpha[ids][:, None, None]
+		beta = self.beta[ids][:, None, None]
+		
+		predicted = self.positions[ids] + self.velocities[ids] * dt
+		residual = corners - predicted
+		positions = predicted + alpha * residual
+		velocities = self.velocities[ids] + beta * residual / dt
+		
+		reset = reset[:, None, None]
+		self.positions[ids] = np.where(reset, corners, positions)
+		self.velocities[ids] = np.where(reset, 0, velocities)
+		self.timestamps[ids] = timestamp
+	
+	def predict(self, ids, timestamp, max_extrapolation=0.1):
+		dt = np.clip(timestamp - self.timestamps[ids], 0, max_extrapolation)
+		dt = np.nan_to_num(dt).astype(np.float32)[:, None, None]
+		return self.positions[ids] + self.velocities[ids] * dt
+
+# keeps the state of all markers of the dictionary in arrays, absent_frames is -1
+# for markers that were never seen. get() returns Marker compatible views.
+class ArrayMarkerTracker:
+	def __init__(self, size=250):
+		self.size = size
+		self.corners = np.zeros((size, 4, 2), dtype=np.float32)
+		self.last_seen = np.full(size, np.nan, dtype=np.float64)
+		self.absent_frames = np.full(size, -1, dtype=np.int32)
+		self.filter = MotionFilter(size)
+		self.views = {}
+	
+	def process_frame(self, marker_corners, marker_ids, timestamp=None):
+		now = timestamp if timestamp is not None else clock.now()
+		
+		self.absent_frames[self.absent_frames >= 0] += 1
+		
+		if marker_ids is not None and len(marker_ids) > 0:
+			ids = np.asarray(marker_ids).reshape(-1)
+			corners = np.asarray(marker_corners, dtype=np.float32).reshape(-1, 4, 2)
+			valid = (ids >= 0) & (ids < self.size)
+			ids = ids[valid]
+			
+			self.corners[ids] = corners[valid]
+			self.absent_frames[ids] = 0
+			self.last_seen[ids] = now
+			self.filter.update(ids, corners[valid], now)
+	
+	@property
+	def present_ids(self):
+		return np.flatnonzero(self.absent_frames == 0)
+	
+	def recent_markers(self, max_absent_frames):
+		recent = (self.absent_frames >= 0) & (self.absent_frames <= max_absent_frames)
+		return [self.get(index) for index in np.flatnonzero(recent)]
+	
+	def get(self, marker_id):
+		marker_id = int(marker_id)
+		
+		if marker_id < 0 or marker_id >= self.size:
+			raise Exception("marker id out of range: " + str(marker_id))
+		
+		if marker_id not in self.views:
+			self.views[marker_id] = MarkerView(self, marker_id)
+		
+		return self.views[marker_id]
+	
+	def get_all(self, *marker_ids):
+		return list(map(self.get, marker_ids))
+
+def copy_array(source, target):
+	if target is None or target.shape != source.shape:
+		return source.copy()
+	
+	np.copyto(target, source)
+	return target
+
+# copy of the state of an ArrayMarkerTracker and the camera frame it was made from.
+# alpha and beta of the filter are shared with the tracker, so configure_filter()
+# on a snapshot view changes the filter of the tracker.
+class TrackerSnapshot:
+	def __init__(self, tracker):
+		self.corners = tracker.corners.copy()
+		self.last_seen = tracker.last_seen.copy()
+		self.absent_frames = tracker.absent_frames.copy()
+		self.filter = MotionFilter(tracker.size, reset_after=tracker.filter.reset_after)
+		self.filter.alpha = tracker.filter.alpha
+		self.filter.beta = tracker.filter.beta
+		self.frame = None
+		self.gray = None
+		self.timestamp = None
+		self.sequence = None
+	
+	def copy_from(self, tracker, frame, gray, timestamp, sequence):
+		np.copyto(self.corners, tracker.corners)
+		np.copyto(self.last_seen, tracker.last_seen)
+		np.copyto(self.absent_frames, tracker.absent_frames)
+		np.copyto(self.filter.positions, tracker.filter.positions)
+		np.copyto(self.filter.velocities, tracker.filter.velocities)
+		np.copyto(self.filter.timestamps, tracker.filter.timestamps)
+		self.frame = copy_array(frame, self.frame)
+		self.gray = copy_array(gray, self.gray)
+		self.timestamp = timestamp
+		self.sequence = sequence
+
+# read side of an ArrayMarkerTracker that is updated on another thread. publish()
+# copies the tracker into a free snapshot, acquire() switches the reader to the
+# latest one. the snapshot being read is never written, so papers always see the
+# state of one complete frame. works like the triple buffer of CameraStream.
+class SnapshotMarkerTracker:
+	def __init__(self, tracker, slot_count=3):
+		self.tracker = tracker
+		self.size = tracker.size
+		self.snapshots = [TrackerSnapshot(tracker) for _ in range(slot_count)]
+		self.latest = None
+		self.reading = 0
+		self.published = 0
+		self.closed = False
+		self.views = {}
+		
+		self.lock = threading.Lock()
+		self.snapshot_available = threading.Condition(self.lock)
+	
+	def free_slot(self):
+		for index in range(len(self.snapshots)):
+			if index != self.latest and index != self.reading:
+				return index
+	
+	# called on the thread that updates the tracker
+	def publish(self, frame, gray, timestamp, sequence):
+		with self.lock:
+			index = self.free_slot()
+		
+		self.snapshots[index].copy_from(self.tracker, frame, gray, timestamp, sequence)
+		
+		with self.lock:
+			self.latest = index
+			self.published += 1
+			self.snapshot_available.notify_all()
+	
+	def close(self):
+		with self.lock:
+			self.closed = True
+			self.snapshot_available.notify_all()
+	
+	# returns the latest snapshot and reads from it until the next acquire(), waits
+	# only until the first snapshot is published. None if there is none (yet).
+	def acquire(self, timeout=None):
+		with self.lock:
+			if self.latest is None:
+				self.snapshot_available.wait_for(lambda: self.latest is not None or self.closed, timeout)
+			
+			if self.latest is None:
+				return None
+			
+			self.reading = self.latest
+			return self.snapshots[self.reading]
+	
+	@property
+	def corners(self):
+		return self.snapshots[self.reading].corners
+	
+	@property
+	def last_seen(self):
+		return self.snapshots[self.reading].last_seen
+	
+	@property
+	def absent_frames(self):
+		return self.snapshots[self.reading].absent_frames
+	
+	@property
+	def filter(self):
+		return self.snapshots[self.reading].filter
+	
+	@property
+	def present_ids(self):
+		return np.flatnonzero(self.absent_frames == 0)
+	
+	def recent_markers(self, max_absent_frames):
+		recent = (self.absent_frames >= 0) & (self.absent_frames <= max_absent_frames)
+		return [self.get(index) for index in np.flatnonzero(recent)]
+	
+	def get(self, marker_id):
+		marker_id = int(marker_id)
+		
+		if marker_id < 0 or marker_id >= self.size:
+			raise Exception("marker id out of range: " + str(marker_id))
+		
+		if marker_id not in self.views:
+			self.views[marker_id] = MarkerView(self, marker_id)
+		
+		return self.views[marker_id]
+	
+	def get_all(self, *marker_ids):
+		return list(map(self.get, marker_ids))
+
+# reads a camera stream on its own thread and calls process_frame with every new
+# frame, at camera rate. start() returns a SnapshotMarkerTracker of the tracker that
+# process_frame updates, the render loop reads markers and frames from it.
+class VisionLoop:
+	def __init__(self, stream, timer=None, scheduler=None):
+		self.stream = stream
+		self.timer = timer if timer is not None else FrameTimer(budget=None)
+		self.scheduler = scheduler
+		self.process_frame = None
+		self.markers = None
+		self.running = False
+		self.finished = False
+		self.exception = None
+		self.thread = None
+	
+	@property
+	def started(self):
+		return self.thread is not None
+	
+	def start(self, process_frame, tracker):
+		self.process_frame = process_frame
+		self.markers = SnapshotMarkerTracker(tracker)
+		
+		self.running = True
+		self.thread = threading.Thread(target=self.run, name="VisionLoop", daemon=True)
+		self.thread.start()
+		return self.markers
+	
+	def stop(self):
+		self.running = False
+		
+		if self.thread is not None:
+			self.thread.join()
+			self.thread = None
+	
+	def run(self):
+		sequence = None
+		
+		try:
+			while self.running:
+				result = self.stream.read(timeout=0.5, after_sequence=sequence)
+				
+				if result is None:
+					if getattr(self.stream, "error", None) is not None:
+						raise self.stream.error
+					
+					if getattr(self.stream, "finished", False):
+						self.finished = True
+						break
+					continue
+				
+				# the latest frame again when the timeout ran out
+				if result[3] == sequence:
+					continue
+				
+				frame, gray, timestamp, sequence = result[:4]
+				marker_detections = result[4:] if len(result) > 4 else None
+				
+				self.timer.begin_frame()
+				self.process_frame(
+					camera_frame=frame,
+					camera_frame_gray=gray,
+					camera_timestamp=timestamp,
+					camera_frame_sequence=sequence,
+					marker_detections=marker_detections,
+					timer=self.timer)
+				
+				with self.timer.stage("publish"):
+					self.markers.publish(frame, gray, timestamp, sequence)
+				
+				# the detection rate follows the cost of the frames of this thread
+				duration = self.timer.end_frame()
+				if self.scheduler is not None:
+					self.scheduler.end_frame(duration)
+		except Exception as e:
+			self.exception = e
+		finally:
+			self.markers.close()
+
 def get_marker_images(*marker_ids, size=200):
-	aruco_dict = aruco.Dictionary_get(aruco.DICT_4X4_250)
+	aruco_dict = get_aruco_dictionary()
 	return [aruco.drawMarker(aruco_dict, marker_id, size) for marker_id in marker_ids]
@@ -0,0 +1,249 @@
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+import cv2 as cv
+import time
+from cyberdesk.vision import get_camera_capture, MarkerDetector, ArrayMarkerTracker, TrackingMarkerDetector
+
+MAX_MARKERS = 250
+
+# meta layout, one row per slot plus one row of global state
+META_TIMESTAMP = 0
+META_SEQUENCE = 1
+META_MARKER_COUNT = 2
+
+META_LATEST = 0
+META_READING = 1
+META_DROPPED = 2
+META_CONSUMED = 3
+
+class VisionSlots:
+	def __init__(self, buffer, camera_size, slot_count, max_markers=MAX_MARKERS):
+		width, height = camera_size
+		self.frames = np.ndarray((slot_count, height, width, 3), dtype=np.uint8, buffer=buffer)
+		offset = self.frames.nbytes
+		self.grays = np.ndarray((slot_count, height, width), dtype=np.uint8, buffer=buffer, offset=offset)
+		offset += self.grays.nbytes
+		self.corners = np.ndarray((slot_count, max_markers, 4, 2), dtype=np.float32, buffer=buffer, offset=offset)
+		offset += self.corners.nbytes
+		self.ids = np.ndarray((slot_count, max_markers), dtype=np.int32, buffer=buffer, offset=offset)
+	
+	@staticmethod
+	def nbytes(camera_size, slot_count, max_markers=MAX_MARKERS):
+		width, height = camera_size
+		return slot_count * (width*height*3 + width*height + max_markers*4*2*4 + max_markers*4)
+
+def free_slot(meta, slot_count):
+	latest = int(meta[slot_count][META_LATEST])
+	reading = int(meta[slot_count][META_READING])
+	
+	for index in range(slot_count):
+		if index != latest and index != reading:
+			return index
+
+def run_vision_worker(memory_name, meta_array, lock, frame_signal, stop_event,
+	camera_size, camera_id, flip, slot_count, detector_options):
+	memory = shared_memory.SharedMemory(name=memory_name)
+	slots = VisionSlots(memory.buf, camera_size, slot_count)
+	meta = np.frombuffer(meta_array.get_obj(), dtype=np.float64).reshape(slot_count+1, 4)
+	
+	capture = get_camera_capture(*camera_size, camera_id=camera_id)
+	tracker = ArrayMarkerTracker()
+	detector = TrackingMarkerDetector(tracker, MarkerDetector(**detector_options))
+	sequence = int(meta[:slot_count, META_SEQUENCE].max())
+	raw = None
+	
+	try:
+		while not stop_event.is_set():
+			ret, raw = capture.read(raw)
+			if not ret:
+				raise Exception("can't read camera frame")
+			
+			now = time.time()
+			
+			with lock:
+				index = free_slot(meta, slot_count)
+			
+			if raw.shape != slots.frames[index].shape:
+				raw = cv.resize(raw, camera_size)
+			
+			cv.flip(raw, flip, dst=slots.frames[index])
+			cv.cvtColor(slots.frames[index], cv.COLOR_BGR2GRAY, dst=slots.grays[index])
+			
+			corners, ids = detector.detect(slots.grays[index])
+			tracker.process_frame(corners, ids, now)
+			
+			count = 0 if ids is None else min(len(ids), MAX_MARKERS)
+			for i in range(count):
+				slots.corners[index][i] = corners[i][0]
+				slots.ids[index][i] = ids[i][0]
+			
+			sequence += 1
+			
+			with lock:
+				meta[index][META_TIMESTAMP] = now
+				meta[index][META_SEQUENCE] = sequence
+				meta[index][META_MARKER_COUNT] = count
+				
+				if meta[slot_count][META_CONSUMED] == 0:
+					meta[slot_count][META_DROPPED] += 1
+				
+				meta[slot_count][META_LATEST] = index
+				meta[slot_count][META_CONSUMED] = 0
+			
+			frame_signal.release()
+	finally:
+		capture.release()
+		del slots
+		memory.close()
+
+class VisionWorker:
+	def __init__(self, camera_size, camera_id=0, flip=-1, slot_count=3,
+		restart_delay=1, lock_timeout=1, detector_options=None):
+		self.camera_size = camera_size
+		self.camera_id = camera_id
+		self.flip = flip
+		self.slot_count = slot_count
+		self.restart_delay = restart_delay
+		self.lock_timeout = lock_timeout
+		self.detector_options = detector_options if detector_options is not None else {}
+		
+		self.memory = None
+		self.slots = None
+		self.process = None
+		self.restarts = 0
+		self.restart_at = None
+		
+		self.context = mp.get_context("spawn")
+		self.lock = self.context.Lock()
+		# released once per frame by the worker. unlike a condition or an event it has
+		# no lock inside that a killed worker could leave taken.
+		self.frame_signal = self.context.Semaphore(0)
+		self.stop_event = self.context.Event()
+		self.meta_array = self.context.Array("d", (slot_count+1) * 4)
+		self.meta = np.frombuffer(self.meta_array.get_obj(), dtype=np.float64).reshape(slot_count+1, 4)
+		self.meta[slot_count][META_LATEST] = -1
+		self.meta[slot_count][META_READING] = -1
+		self.meta[slot_count][META_CONSUMED] = 1
+	
+	@property
+	def dropped_frames(self):
+		return int(self.meta[self.slot_count][META_DROPPED])
+	
+	def start(self):
+		if self.memory is None:
+			size = VisionSlots.nbytes(self.camera_size, self.slot_count)
+			self.memory = shared_memory.SharedMemory(create=True, size=size)
+			self.slots = VisionSlots(self.memory.buf, self.camera_size, self.slot_count)
+		
+		self.stop_event.clear()
+		self.process = self.context.Process(target=run_vision_worker, name="VisionWorker", daemon=True, args=(
+			self.memory.name, self.meta_array, self.lock, self.frame_signal, self.stop_event,
+			self.camera_size, self.camera_id, self.flip, self.slot_count, self.detector_options))
+		self.process.start()
+		
+		return self
+	
+	# returns True if the worker is running
+	def check_process(self):
+		if self.process is None or self.process.is_alive():
+			return True
+		
+		if self.restart_at is None:
+			print("vision worker died with exit code", self.process.exitcode)
+			self.restart_at = time.time() + self.restart_delay
+		elif time.time() >= self.restart_at:
+			self.restart_at = None
+			self.restarts += 1
+			print("restarting vision worker")
+			
+			# a worker killed while holding the lock never releases it
+			self.lock = self.context.Lock()
+			self.start()
+			return True
+		
+		return False
+	
+	def kill(self):
+		if self.process is not None and self.process.is_alive():
+			self.process.kill()
+			self.process.join()
+	
+	def poll(self):
+		running = self.check_process()
+		
+		# without a running worker nobody writes the slots and the lock may be lost
+		if running and not self.lock.acquire(timeout=self.lock_timeout):
+			print("vision worker holds the lock for too long, killing it")
+			self.kill()
+			return None
+		
+		try:
+			index = int(self.meta[self.slot_count][META_LATEST])
+			if index < 0:
+				return None
+			
+			self.meta[self.slot_count][META_READING] = index
+			self.meta[self.slot_count][META_CONSUMED] = 1
+			timestamp, sequence, count = self.meta[index][:3]
+		finally:
+			if running:
+				self.lock.release()
+		
+		count = int(count)
+		if count > 0:
+			corners = list(self.slots.corners[index][:count].reshape(count, 1, 4, 2).copy())
+			ids = self.slots.ids[index][:count].reshape(count, 1).copy()
+		else:
+			corners, ids = [], None
+		
+		return self.slots.frames[index], self.slots.grays[index], timestamp, int(sequence), corners, ids
+	
+	# returns (frame, gray, timestamp, sequence, corners, ids) of the newest frame,
+	# the arrays stay valid until the next read(). None if there is no frame (yet).
+	# the timeout starts again whenever the worker is restarted while waiting. with
+	# after_sequence it waits for a frame with another sequence.
+	def read(self, wait=True, timeout=10, after_sequence=None):
+		result = self.poll()
+		deadline = time.time() + timeout if timeout is not None else None
+		restarts = self.restarts
+		
+		while wait and (result is None or (after_sequence is not None and result[3] == after_sequence)):
+			if self.restarts != restarts:
+				restarts = self.restarts
+				deadline = time.time() + timeout if timeout is not None else None
+			
+			if deadline is not None and time.time() >= deadline:
+				break
+			
+			# wake up now and then to restart a dead worker
+			wait_time = 0.1 if deadline is None else max(0, min(0.1, deadline - time.time()))
+			if self.frame_signal.acquire(timeout=wait_time):
+				while self.frame_signal.acquire(False):
+					pass
+			
+			result = self.poll()
+		
+		return result
+	
+	def stop(self, timeout=2):
+		self.stop_event.set()
+		
+		if self.process is not None:
+			self.process.join(timeout)
+			if self.process.is_alive():
+				self.process.terminate()
+				self.process.join()
+			self.process = None
+		
+		if self.memory is not None:
+			self.slots = None
+			self.memory.close()
+			self.memory.unlink()
+			self.memory = None
+	
+	def __enter__(self):
+		return self.start()
+	
+	def __exit__(self, type, value, traceback):
+		self.stop()
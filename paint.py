@@ -19,7 +19,9 @@ marker_colors = {
 	"7": Color.WHITE,
 }
 
-def draw(ctx, marker_corners, marker_ids, perspective_transform):
+def draw(canvas, marker_corners, marker_ids, perspective_transform):
+	ctx = canvas.ctx
+	
 	if marker_ids is not None:
 		for i in range(len(marker_ids)):
 			marker_id = str(marker_ids[i][0])
@@ -31,20 +33,22 @@ def draw(ctx, marker_corners, marker_ids, perspective_transform):
 				if marker_id == "0":
 					radius = 30
 				
+				center = get_center(corners)
 				ctx.set_source_rgb(*marker_colors[marker_id])
-				ctx.arc(*get_center(corners), radius, 0, 2*math.pi)
+				ctx.arc(*center, radius, 0, 2*math.pi)
 				ctx.fill()
+				canvas.mark_dirty(center[0] - radius - 1, center[1] - radius - 1, 2*radius + 2, 2*radius + 2)
 
 @projection
 def paint(projection_size, projection_rect, perspective_transform, **kwargs):
-	canvas = CanvasTexture(projection_size)
+	canvas = CanvasTexture(projection_size, track_changes="explicit")
 	material = Material(shader=quad_shader(), texture=canvas.texture)
 	geometry = QuadGeometry(projection_rect)
 	
 	def render(camera, camera_frame_gray, **kwargs):
 		marker_corners, marker_ids = detect_markers(camera_frame_gray)
 		
-		draw(canvas.ctx, marker_corners, marker_ids, perspective_transform)
+		draw(canvas, marker_corners, marker_ids, perspective_transform)
 		
 		canvas.update()
 		camera.render(geometry, material)
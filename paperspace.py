@@ -1,32 +1,68 @@
 import os
-import json
-from cyberdesk.vision import MarkerTracker, detect_markers
+from cyberdesk.vision import ArrayMarkerTracker, TrackingMarkerDetector
 from cyberdesk.app import projection, run
 from cyberdesk.paperspace import Space
 from cyberdesk.paperspace.papers import parse_paper_json
+from cyberdesk.iohub import io_hub
+from cyberdesk.paperspace.reload import PapersFileWatcher, load_paper_entries, apply_paper_entries
 
 @projection
-def paperspace(camera_size, perspective_transform, **kwargs):
-	markers = MarkerTracker()
+def paperspace(window, camera_size, perspective_transform, timer, scheduler=None, detection_scheduler=None, vision=None, **kwargs):
+	markers = ArrayMarkerTracker()
+	detector = TrackingMarkerDetector(markers)
 	
-	space = Space(camera_size, perspective_transform)
+	def process_frame(camera_frame_gray, camera_timestamp, timer, marker_detections=None, **kwargs):
+		# when the vision thread can't keep up with the camera, markers are detected on
+		# fewer frames and the tracker keeps their state
+		if marker_detections is None and detection_scheduler is not None and not detection_scheduler.should_detect():
+			return
+		
+		if marker_detections is None:
+			with timer.stage("detect"):
+				marker_detections = detector.detect(camera_frame_gray)
+		
+		with timer.stage("tracker"):
+			markers.process_frame(*marker_detections, timestamp=camera_timestamp)
+	
+	# with a vision thread, papers read a snapshot of the tracker that is swapped
+	# once per camera frame, while rendering runs at display refresh
+	paper_markers = vision.start(process_frame, markers) if vision is not None else markers
+	
+	space = Space(camera_size, perspective_transform, timer=timer, scheduler=scheduler)
+	window.on_hide(io_hub().stop)
 	
 	if not os.path.exists("papers.json"):
 		print('papers.json not found. create some papers with "python create-papers.py" first')
 		sys.exit(1)
 	
-	with open("papers.json", "r") as file:
-		for data in json.load(file):
-			space.add_paper(data["id"], parse_paper_json(data, markers))
+	watcher = PapersFileWatcher("papers.json")
+	entries = load_paper_entries("papers.json")
+	for paper_id, data in entries.items():
+		space.add_paper(paper_id, parse_paper_json(data, paper_markers))
 	
-	def render(camera, camera_frame, camera_frame_gray, **kwargs):
-		markers.process_frame(*detect_markers(camera_frame_gray))
+	def render(camera, camera_frame, camera_frame_sequence, **kwargs):
+		nonlocal entries
+		
+		# papers created while running are added without a restart
+		new_entries = watcher.poll()
+		if new_entries is not None:
+			entries = apply_paper_entries(space, entries, new_entries, lambda data: parse_paper_json(data, paper_markers))
+			
+			# papers that failed, e.g. because their video file isn't there yet, are tried again
+			if entries != new_entries:
+				watcher.retry()
+		
+		if vision is None:
+			process_frame(**kwargs)
 		
 		space.camera = camera
 		space.current_camera_frame = camera_frame
+		space.current_camera_frame_sequence = camera_frame_sequence
 		
-		space.update()
-		space.render()
+		with timer.stage("space.update"):
+			space.update()
+		with timer.stage("space.render"):
+			space.render()
 	
 	return render
 
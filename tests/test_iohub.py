@@ -0,0 +1,199 @@
+import time
+import threading
+import unittest
+from cyberdesk.iohub import IOHub, LocalBroker, MqttConnection, topic_matches
+
+class TopicMatchesTest(unittest.TestCase):
+	def test_wildcards(self):
+		self.assertTrue(topic_matches("zigbee2mqtt/button", "zigbee2mqtt/button"))
+		self.assertTrue(topic_matches("zigbee2mqtt/+/action", "zigbee2mqtt/button/action"))
+		self.assertTrue(topic_matches("zigbee2mqtt/#", "zigbee2mqtt/button/action"))
+		self.assertFalse(topic_matches("zigbee2mqtt/+", "zigbee2mqtt/button/action"))
+		self.assertFalse(topic_matches("zigbee2mqtt/button/action", "zigbee2mqtt/button"))
+
+class IOHubTest(unittest.TestCase):
+	def setUp(self):
+		self.broker = LocalBroker()
+		self.hub = IOHub(connection_factory=self.broker.connect, linger=0.05).start()
+	
+	def tearDown(self):
+		self.hub.stop()
+	
+	# broker messages are delivered on the hub thread, sync() waits until they arrived
+	def publish(self, topic, payload, host="broker"):
+		self.hub.sync()
+		self.broker.publish(topic, payload, host, 1883)
+		self.hub.sync()
+	
+	def test_subscribe(self):
+		subscription = self.hub.subscribe("broker", "zigbee2mqtt/button")
+		
+		self.publish("zigbee2mqtt/button", b"single")
+		self.publish("zigbee2mqtt/other", b"double")
+		
+		self.assertEqual(subscription.drain(), [("zigbee2mqtt/button", b"single")])
+		self.assertEqual(subscription.drain(), [])
+	
+	def test_wildcard_dispatch(self):
+		actions = self.hub.subscribe("broker", "zigbee2mqtt/+/action")
+		everything = self.hub.subscribe("broker", "zigbee2mqtt/#")
+		
+		self.publish("zigbee2mqtt/button/action", b"single")
+		self.publish("zigbee2mqtt/button/battery", b"90")
+		
+		self.assertEqual(actions.drain(), [("zigbee2mqtt/button/action", b"single")])
+		self.assertEqual(everything.drain(), [
+			("zigbee2mqtt/button/action", b"single"),
+			("zigbee2mqtt/button/battery", b"90"),
+		])
+	
+	def test_shared_connection(self):
+		first = self.hub.subscribe("broker", "zigbee2mqtt/button")
+		second = self.hub.subscribe("broker", "zigbee2mqtt/button")
+		self.hub.sync()
+		
+		self.assertEqual(len(self.broker.connections), 1)
+		
+		self.publish("zigbee2mqtt/button", b"single")
+		self.assertEqual(len(first.drain()), 1)
+		self.assertEqual(len(second.drain()), 1)
+	
+	def test_linger(self):
+		subscription = self.hub.subscribe("broker", "zigbee2mqtt/button")
+		self.hub.sync()
+		connection = self.broker.connections[0]
+		
+		self.hub.unsubscribe(subscription)
+		self.hub.sync()
+		self.assertIn("zigbee2mqtt/button", connection.topics)
+		
+		# subscribing again within linger keeps the topic and the connection
+		subscription = self.hub.subscribe("broker", "zigbee2mqtt/button")
+		time.sleep(0.1)
+		self.hub.sync()
+		self.assertEqual(self.broker.connections, [connection])
+		
+		self.hub.unsubscribe(subscription)
+		time.sleep(0.1)
+		self.hub.sync()
+		self.assertNotIn("zigbee2mqtt/button", connection.topics)
+		self.assertEqual(self.broker.connections, [])
+	
+	def test_unsubscribed_gets_no_messages(self):
+		subscription = self.hub.subscribe("broker", "zigbee2mqtt/button")
+		self.hub.unsubscribe(subscription)
+		
+		self.publish("zigbee2mqtt/button", b"single")
+		self.assertEqual(subscription.drain(), [])
+	
+	def test_publish_connection_closes_when_idle(self):
+		self.hub.publish("broker", "zigbee2mqtt/light/set", b"on")
+		self.hub.sync()
+		
+		self.assertEqual(len(self.broker.connections), 1)
+		self.assertEqual(self.broker.published, [("broker", 1883, "zigbee2mqtt/light/set", b"on")])
+		
+		time.sleep(0.1)
+		self.hub.sync()
+		self.assertEqual(self.broker.connections, [])
+	
+	def test_stop_closes_connections(self):
+		self.hub.subscribe("broker", "zigbee2mqtt/button")
+		self.hub.subscribe("other-broker", "zigbee2mqtt/button")
+		self.hub.sync()
+		self.assertEqual(len(self.broker.connections), 2)
+		
+		self.hub.stop()
+		self.assertEqual(self.broker.connections, [])
+
+# stands in for the paho client, connect() blocks until the test lets it finish and
+# the connack arrives on the loop like paho's on_connect would
+class SlowClient:
+	instances = []
+	
+	def __init__(self):
+		self.connect_allowed = threading.Event()
+		self.published = []
+		self.loop = None
+		SlowClient.instances.append(self)
+	
+	def connect(self, host, port):
+		self.connect_allowed.wait(5)
+		self.loop.call_soon_threadsafe(self.on_connect, self, None, {}, 0)
+	
+	def reconnect(self):
+		self.connect(None, None)
+	
+	def subscribe(self, topic):
+		pass
+	
+	def unsubscribe(self, topic):
+		pass
+	
+	def publish(self, topic, payload):
+		self.published.append((topic, payload))
+	
+	def disconnect(self):
+		pass
+	
+	def loop_misc(self):
+		return 0
+
+class MqttConnectionTest(unittest.TestCase):
+	def setUp(self):
+		SlowClient.instances = []
+		self.hub = IOHub(connection_factory=self.connect, linger=0.05).start()
+	
+	def tearDown(self):
+		for client in SlowClient.instances:
+			client.connect_allowed.set()
+		self.hub.stop()
+	
+	def connect(self, loop, host, port, on_message):
+		connection = MqttConnection(loop, host, port, on_message, client_factory=SlowClient)
+		connection.client.loop = loop
+		return connection
+	
+	def test_publish_before_connect(self):
+		self.hub.publish("broker", "zigbee2mqtt/light/set", b"on")
+		self.hub.publish("broker", "zigbee2mqtt/light/set", b"off")
+		self.hub.sync()
+		
+		client = SlowClient.instances[0]
+		self.assertEqual(client.published, [])
+		
+		# the connection is not closed as idle while messages wait for the connect
+		time.sleep(0.1)
+		self.hub.sync()
+		self.assertEqual(len(self.hub.connections), 1)
+		
+		client.connect_allowed.set()
+		deadline = time.time() + 1
+		while not client.published and time.time() < deadline:
+			time.sleep(0.01)
+		self.hub.sync()
+		
+		self.assertEqual(client.published, [("zigbee2mqtt/light/set", b"on"), ("zigbee2mqtt/light/set", b"off")])
+	
+	def test_publish_while_reconnecting(self):
+		self.hub.publish("broker", "zigbee2mqtt/light/set", b"on")
+		self.hub.sync()
+		
+		client = SlowClient.instances[0]
+		client.connect_allowed.set()
+		deadline = time.time() + 1
+		while not client.published and time.time() < deadline:
+			time.sleep(0.01)
+		
+		connection = self.hub.connections[("broker", 1883)]
+		self.hub.call(connection.on_disconnect, client, None, 1)
+		self.hub.publish("broker", "zigbee2mqtt/light/set", b"off")
+		self.hub.sync()
+		self.assertEqual(client.published, [("zigbee2mqtt/light/set", b"on")])
+		
+		self.hub.call(connection.on_connect, client, None, {}, 0)
+		self.hub.sync()
+		self.assertEqual(client.published, [("zigbee2mqtt/light/set", b"on"), ("zigbee2mqtt/light/set", b"off")])
+
+if __name__ == "__main__":
+	unittest.main()